@@ -0,0 +1,373 @@
+"""
+Cache of public API responses with tag-based invalidation.
+
+Every cached response depends on tags (e.g. "event:42", "events:month:2025-07",
+"place:7"). Each tag has a generation counter in Redis, generations of all
+tags of a response are part of its cache key. Write paths bump generations
+of changed tags, so the next request builds a new key and old entries are
+never read again (they just expire by TTL).
+
+DSN site edits events and places in the database directly, so its changes
+are seen only after hard TTL unless the site calls `/api/invalidate_cache/`
+on save. TTLs are short by default and can be raised with `API_CACHE_EVENTS_TTL`
+and `API_CACHE_PLACES_TTL` (seconds) once the site calls it.
+
+Entries have soft and hard TTL (see `get_or_compute`): stale entries are
+served while one process refreshes them, so expiry of a popular key
+doesn't turn into a burst of identical database queries.
+
+Read path is asynchronous (`redis.asyncio`) for FastAPI handlers,
+invalidation is synchronous for crud and celery tasks.
+
+Payloads from `COMPRESS_MIN_SIZE` bytes are stored compressed with zstd
+(zlib if zstandard isn't installed), see `stats` for hit and size metrics.
+
+Tags of events:
+    "events" - all events, bumped when changed events are unknown
+    "events:open" - list requests without (or with too wide) date range
+    "events:month:YYYY-MM" - list requests with date range by months
+    "event:<id>" - requests by event ids
+Tags of places:
+    "places" - all places
+    "place:<id>" - requests by place ids
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import zlib
+from collections import Counter
+from datetime import date, datetime
+from typing import Awaitable, Callable, Iterable, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from davai_s_nami_bot.celery_app import async_redis_client, redis_client
+from .logger import get_logger
+
+
+EVENTS_TTL = int(os.environ.get("API_CACHE_EVENTS_TTL", 60 * 10))
+PLACES_TTL = int(os.environ.get("API_CACHE_PLACES_TTL", 60 * 10))
+# generation must outlive every entry built with it
+GENERATION_TTL = 60 * 60 * 24 * 7
+# wider date ranges depend on "events:open" tag
+MAX_MONTH_TAGS = 24
+# entry is fresh for this part of TTL, then stale one is served while refreshing
+SOFT_TTL_RATIO = 0.5
+# +-10% of TTL, entries made together don't expire together
+TTL_JITTER = 0.1
+# single-flight lock of computing one key
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 5
+LOCK_POLL_INTERVAL = 0.05
+# payloads from this size (bytes) are compressed
+COMPRESS_MIN_SIZE = 4096
+ZSTD_LEVEL = 3
+ZLIB_LEVEL = 6
+CODEC = "zstd" if zstandard is not None else "zlib"
+
+CACHE_KEY = "api_cache:{name}:{params}:{generations}"
+GENERATION_KEY = "api_cache:tag:{tag}"
+LOCK_KEY = "{key}:lock"
+STATS_KEY = "api_cache:stats"
+
+ALL_EVENTS_TAG = "events"
+OPEN_EVENTS_TAG = "events:open"
+ALL_PLACES_TAG = "places"
+
+log = get_logger(__file__)
+
+
+def events_tags(params) -> List[str]:
+    """
+    Tags of `get_events_by_date_and_category` result for `EventRequestParameters`.
+    """
+    if params.ids:
+        return [ALL_EVENTS_TAG] + [f"event:{event_id}" for event_id in params.ids]
+
+    months = None
+    if params.date_to is not None:
+        months = _month_tags(params.date_from, params.date_to)
+
+    return [ALL_EVENTS_TAG] + (months or [OPEN_EVENTS_TAG])
+
+
+def places_tags(params) -> List[str]:
+    """
+    Tags of `get_places` result for `PlaceRequestParameters`.
+    """
+    return [ALL_PLACES_TAG] + [f"place:{place_id}" for place_id in params.ids or []]
+
+
+async def cache_key(name: str, params: dict, tags: List[str]) -> str:
+    """
+    Cache key of response `name` for request `params` with current generations of `tags`.
+    """
+    params_hash = hashlib.md5(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+    generations = ".".join(map(str, await _generations(tags)))
+    generations_hash = hashlib.md5(generations.encode()).hexdigest()
+
+    return CACHE_KEY.format(name=name, params=params_hash, generations=generations_hash)
+
+
+async def get_or_compute(
+    key: str, compute: Callable[[], Awaitable[bytes]], ttl: int
+) -> Tuple[bytes, bool]:
+    """
+    Cached value of `key` or result of `compute` (encoded payload) stored for `ttl` seconds.
+
+    Entry is fresh for about `SOFT_TTL_RATIO` of `ttl` and is kept in Redis
+    for about `ttl` (both with jitter, so entries made together don't expire
+    together). Stale entry is returned at once and refreshed in background.
+    Only one process computes value of missed key (lock in Redis), others
+    wait for it up to `LOCK_WAIT` seconds.
+
+    Returns
+    -------
+    tuple
+        Value and flag if value is from cache.
+    """
+    entry = await _read(key)
+    if entry is not None:
+        value, fresh_until = entry
+        if fresh_until > time.time():
+            _stats["hits"] += 1
+        else:
+            _stats["stale_hits"] += 1
+            if await _lock(key):
+                task = asyncio.create_task(_refresh(key, compute, ttl))
+                _refresh_tasks.add(task)
+                task.add_done_callback(_refresh_tasks.discard)
+        return value, True
+
+    _stats["misses"] += 1
+    if await _lock(key):
+        try:
+            return await _compute_and_store(key, compute, ttl), False
+        finally:
+            await _unlock(key)
+
+    deadline = time.time() + LOCK_WAIT
+    while time.time() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        entry = await _read(key)
+        if entry is not None:
+            return entry[0], True
+
+    return await compute(), False
+
+
+async def stats() -> dict:
+    """
+    Lookups of current process and sizes of stored entries of all processes.
+
+    Returns
+    -------
+    dict
+        `hits`, `stale_hits`, `misses`, `hit_ratio` of current process;
+        `stored`, `compressed` entries, their `raw_bytes` and `stored_bytes`
+        (sizes before and after compression) and `compression_ratio`.
+    """
+    lookups = sum(_stats.values())
+    result = {
+        "hits": _stats["hits"],
+        "stale_hits": _stats["stale_hits"],
+        "misses": _stats["misses"],
+        "hit_ratio": (_stats["hits"] + _stats["stale_hits"]) / lookups if lookups else None,
+    }
+
+    try:
+        stored = await async_redis_client.hgetall(STATS_KEY)
+    except RedisError as e:
+        log.warning(f"API cache is unavailable: {e}")
+        stored = {}
+
+    for name in ("stored", "compressed", "raw_bytes", "stored_bytes"):
+        result[name] = int(stored.get(name.encode(), 0))
+    result["compression_ratio"] = (
+        result["raw_bytes"] / result["stored_bytes"] if result["stored_bytes"] else None
+    )
+
+    return result
+
+
+def invalidate_events(events: Iterable[Tuple[int, Optional[datetime], Optional[datetime]]] = None):
+    """
+    Bump tags of changed events.
+
+    Parameters
+    ----------
+    events : Iterable of (id, from_date, to_date)
+        Changed events. If None, all cached events are invalidated.
+    """
+    if events is None:
+        _bump([ALL_EVENTS_TAG])
+        return
+
+    tags = {OPEN_EVENTS_TAG}
+    for event_id, from_date, to_date in events:
+        tags.add(f"event:{event_id}")
+
+        if from_date is None:
+            tags.add(ALL_EVENTS_TAG)
+            continue
+
+        months = _month_tags(from_date, to_date or from_date)
+        if months is None:
+            tags.add(ALL_EVENTS_TAG)
+        else:
+            tags.update(months)
+
+    _bump(sorted(tags))
+
+
+def invalidate_places(place_ids: Iterable[int] = None):
+    """
+    Bump tags of changed places (all places if `place_ids` is None).
+    """
+    _bump([ALL_PLACES_TAG] + [f"place:{place_id}" for place_id in place_ids or []])
+
+
+async def _generations(tags: List[str]) -> List[int]:
+    if not tags:
+        return []
+
+    try:
+        values = await async_redis_client.mget([GENERATION_KEY.format(tag=tag) for tag in tags])
+    except RedisError as e:
+        log.warning(f"API cache is unavailable: {e}")
+        # unique key: nothing is read from cache without generations
+        return [datetime.now().timestamp()]
+
+    return [int(value or 0) for value in values]
+
+
+def _bump(tags: List[str]):
+    try:
+        pipe = redis_client.pipeline()
+        for tag in tags:
+            key = GENERATION_KEY.format(tag=tag)
+            pipe.incr(key)
+            pipe.expire(key, GENERATION_TTL)
+        pipe.execute()
+    except RedisError as e:
+        log.error(f"Failed to invalidate API cache tags {tags}: {e}")
+
+
+def _month_tags(start: date, end: date) -> Optional[List[str]]:
+    year, month = start.year, start.month
+    months = []
+    while (year, month) <= (end.year, end.month):
+        if len(months) == MAX_MONTH_TAGS:
+            return None
+
+        months.append(f"events:month:{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    return months
+
+
+async def _read(key: str) -> Optional[Tuple[bytes, float]]:
+    try:
+        value, fresh_until, codec = await async_redis_client.hmget(
+            key, "data", "fresh_until", "codec"
+        )
+    except RedisError as e:
+        log.warning(f"API cache is unavailable: {e}")
+        return None
+
+    if value is None:
+        return None
+
+    try:
+        value = _decompress(value, codec)
+    except Exception as e:
+        log.warning(f"Broken API cache entry {key}: {e}")
+        return None
+
+    return value, float(fresh_until or 0)
+
+
+async def _compute_and_store(key: str, compute: Callable[[], Awaitable[bytes]], ttl: int) -> bytes:
+    value = await compute()
+    now = time.time()
+
+    if len(value) >= COMPRESS_MIN_SIZE:
+        codec, stored = CODEC, await asyncio.to_thread(_compress, value)
+    else:
+        codec, stored = "", value
+
+    try:
+        pipe = async_redis_client.pipeline()
+        pipe.hset(key, mapping={
+            "data": stored,
+            "fresh_until": now + ttl * SOFT_TTL_RATIO * _jitter(),
+            "codec": codec,
+        })
+        pipe.expire(key, int(ttl * _jitter()))
+        pipe.hincrby(STATS_KEY, "stored", 1)
+        pipe.hincrby(STATS_KEY, "compressed", int(bool(codec)))
+        pipe.hincrby(STATS_KEY, "raw_bytes", len(value))
+        pipe.hincrby(STATS_KEY, "stored_bytes", len(stored))
+        await pipe.execute()
+    except RedisError as e:
+        log.warning(f"API cache is unavailable: {e}")
+
+    return value
+
+
+async def _refresh(key: str, compute: Callable[[], Awaitable[bytes]], ttl: int):
+    try:
+        await _compute_and_store(key, compute, ttl)
+    except Exception:
+        log.exception(f"Failed to refresh API cache {key}")
+    finally:
+        await _unlock(key)
+
+
+async def _lock(key: str) -> bool:
+    try:
+        return bool(await async_redis_client.set(LOCK_KEY.format(key=key), 1, nx=True, ex=LOCK_TIMEOUT))
+    except RedisError as e:
+        log.warning(f"API cache is unavailable: {e}")
+        return True
+
+
+async def _unlock(key: str):
+    try:
+        await async_redis_client.delete(LOCK_KEY.format(key=key))
+    except RedisError as e:
+        log.warning(f"API cache is unavailable: {e}")
+
+
+def _compress(value: bytes) -> bytes:
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(value)
+    return zlib.compress(value, ZLIB_LEVEL)
+
+
+def _decompress(value: bytes, codec: Optional[bytes]) -> bytes:
+    if not codec:
+        return value
+    if codec == b"zstd":
+        return zstandard.ZstdDecompressor().decompress(value)
+    if codec == b"zlib":
+        return zlib.decompress(value)
+    raise ValueError(f"Unknown codec {codec}")
+
+
+def _jitter() -> float:
+    return random.uniform(1 - TTL_JITTER, 1 + TTL_JITTER)
+
+
+# references of running background refreshes (event loop keeps only weak ones)
+_refresh_tasks = set()
+# lookups of current process
+_stats = Counter()
@@ -2,6 +2,7 @@ import os
 from celery import Celery
 from celery.schedules import crontab
 from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
 
 
 def create_celery_app():
@@ -22,6 +23,10 @@ def create_celery_app():
                 'task': 'davai_s_nami_bot.celery_tasks.schedule_posting_tasks',
                 'schedule': crontab(minute='*/5'),
             },
+            'prerender-posters': {
+                'task': 'davai_s_nami_bot.celery_tasks.prerender_posters',
+                'schedule': crontab(minute='*/30'),
+            },
             'update-events': {
                 'task': 'davai_s_nami_bot.celery_tasks.full_update',
                 'schedule': crontab(hour=0, minute=0),
@@ -36,4 +41,6 @@ def create_celery_app():
 celery_app = create_celery_app()
 
 redis_host = os.getenv('REDIS_HOST', 'localhost')
-redis_client = Redis(host=redis_host, port=6379, db=0)
\ No newline at end of file
+redis_client = Redis(host=redis_host, port=6379, db=0)
+# for FastAPI handlers, doesn't block event loop
+async_redis_client = AsyncRedis(host=redis_host, port=6379, db=0)
\ No newline at end of file
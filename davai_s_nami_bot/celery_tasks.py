@@ -1,20 +1,26 @@
 import datetime, json
-import requests
 from bs4 import BeautifulSoup
 
 from davai_s_nami_bot.celery_app import celery_app, redis_client
 from celery import chain, chord
 
 from datetime import datetime, timedelta
+from functools import partial
 
 from .pydantic_models import EventRequestParameters, PlaceRequestParameters
 
+from . import api_cache
 from . import crud
 from . import clients
 from . import events
+from . import http_cache
+from . import http_client
+from . import images
 from . import utils
 from . import dsn_site
 from . import dsn_site_session
+from . import scraping
+from . import sync_state
 from .datetime_utils import get_msk_today, STRFTIME
 from .logger import get_logger, LOG_FILE, log_task
 
@@ -23,6 +29,8 @@ from .helper.claude_helper import ClaudeHelper
 # from .helper.open_ai_event_moderator import OpenAIEventModerator
 from .helper.claude_event_moderator import ClaudeEventModerator
 
+INSERT_BATCH_SIZE = 500
+
 log = get_logger(__file__)
 dev_channel = clients.DevClient()
 
@@ -33,9 +41,15 @@ def post_to_telegram():
 
     event = dsn_site.next_event_to_channel()
     if event is not None:
-        image_path = utils.prepare_image(event.image)
-        clients.Clients().send_post(event=event, image_path=image_path)
-        log.info("Event was posted")
+        image = utils.prepare_image(event.image)
+        results = clients.Clients().send_post(event=event, image=image)
+        for result in results:
+            clients.log_post_result(result)
+
+        if any(result.ok for result in results):
+            log.info("Event was posted")
+        else:
+            log.error("Event wasn't posted to any channel")
     else:
         log.info("Event not found (or time was changed) or already posted")
     schedule_posting_tasks.apply_async()
@@ -79,6 +93,18 @@ def schedule_posting_tasks():
         log.info(f"Posting task scheduled to {event_time_str}")
 
 
+@celery_app.task
+def prerender_posters():
+    """
+    Render posters of events scheduled for the next `images.PRERENDER_AHEAD`,
+    so posting doesn't wait for download and encoding.
+    """
+    image_urls = crud.get_images_to_post(datetime.utcnow() + images.PRERENDER_AHEAD)
+    rendered = images.prerender_posters(image_urls)
+    evicted = images.evict_posters()
+    log.info(f"Prerendered {rendered} of {len(image_urls)} posters, evicted {evicted} posters")
+
+
 @celery_app.task
 def update_events():
     log.info("Start updating events.")
@@ -102,19 +128,27 @@ def update_events():
         dsn_site_session.make_post_text(inserted_ids)
 
     log.info("Getting new events from other organizations for next 7 days")
-    other_events = events.from_not_approved_organizations(days=7)
-    log.info(f"Collected {len(other_events)} events")
+    other_events = events.stream_from_not_approved_organizations(
+        days=7, incremental=True, results=True
+    )
 
-    _update_events(other_events, table="events_eventsnotapprovednew", msk_today=msk_today)
+    _update_events_stream(other_events, table="events_eventsnotapprovednew", msk_today=msk_today)
+    http_cache.log_stats()
 
-    events_count = len(crud.get_events_from_all_tables())
+    _log_events_statistics()
 
-    log.info(f"Events count in database: {events_count}")
 
+def _log_events_statistics():
+    statistics = crud.get_events_statistics()
 
-def _update_events(events, table, msk_today):
-    dsn_site_session.create_session()
+    log.info(f"Events count in database: {statistics['total']}")
+    for name, count in statistics['tables'].items():
+        log.info(f"  {name}: {count}")
+    for status, count in statistics['statuses'].items():
+        log.info(f"  status {status}: {count}")
 
+
+def _update_events(events, table, msk_today):
     log.info("Checking for existing events")
     new_events = dsn_site.get_new_events(events)
     log.info(f"New events count = {len(new_events)}")
@@ -132,6 +166,48 @@ def _update_events(events, table, msk_today):
 
         return inserted_ids
 
+def _update_events_stream(events_stream, table, msk_today):
+    """
+    Dedup and insert streamed events by batches of `INSERT_BATCH_SIZE`,
+    so first batches are inserted while other pages are still downloading.
+
+    Sync state of a source (`sync` of its `scraping.SourceResult` in the
+    stream) is saved only after the batch with its last events is inserted.
+    """
+    collected = 0
+    inserted_ids = []
+    seen = set()
+    batch = []
+    finished = []
+
+    def flush():
+        nonlocal collected
+        if batch:
+            collected += len(batch)
+            inserted_ids.extend(_update_events(batch, table=table, msk_today=msk_today) or [])
+            batch.clear()
+
+        for result in finished:
+            if result.ok and result.sync is not None:
+                sync_state.mark_synced(result.sync.window, result.sync.hashes)
+        finished.clear()
+
+    for item in events_stream:
+        if isinstance(item, scraping.SourceResult):
+            finished.append(item)
+        elif item.event_id not in seen:
+            seen.add(item.event_id)
+            batch.append(item)
+            if len(batch) >= INSERT_BATCH_SIZE:
+                flush()
+
+    flush()
+
+    log.info(f"Collected {collected} events, inserted {len(inserted_ids)} events")
+
+    return inserted_ids
+
+
 @celery_app.task
 def update_event_from_sites(sites=None, days=7):
     if sites is None or sites[0] == 'all':
@@ -139,17 +215,19 @@ def update_event_from_sites(sites=None, days=7):
     log.info("Start updating events from special sites.")
     msk_today = get_msk_today()
 
-    for site in sites:
-        if site in events.escraper_sites.keys():
-            log.info(f"Getting new events from {site} for next {days} days")
-            other_events = events.escraper_sites[site](days)
-            log.info(f"Collected {len(other_events)} events")
-
-            _update_events(other_events, table="events_eventsnotapprovednew", msk_today=msk_today)
+    streams = {
+        site: partial(events.escraper_streams[site], days)
+        for site in sites if site in events.escraper_streams.keys()
+    }
+    log.info(f"Getting new events from {', '.join(streams)} for next {days} days")
 
-    events_count = len(crud.get_events_from_all_tables())
+    _update_events_stream(
+        scraping.stream_concurrently(streams),
+        table="events_eventsnotapprovednew",
+        msk_today=msk_today,
+    )
 
-    log.info(f"Events count in database: {events_count}")
+    _log_events_statistics()
 
 
 @celery_app.task
@@ -215,7 +293,7 @@ def events_from_url(event_url=None):
 @celery_app.task
 def download_event_page(urls=[]):
     for url in urls:
-        response = requests.get(url)
+        response = http_client.get_session("pages", cache=True).get(url)
         if response.status_code < 300:
             body = BeautifulSoup(response.text, 'html.parser').get_text()
             event = {'full_text': body, 'url': url}
@@ -275,6 +353,8 @@ def update_approved_events(event_ids):
 @log_task
 @celery_app.task
 def full_update():
+    # places are edited on the site, cached API responses are refreshed nightly
+    api_cache.invalidate_places()
     update_parameters.apply_async()
     is_empty_check.apply_async()
     move_approved.apply_async()
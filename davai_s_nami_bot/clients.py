@@ -1,16 +1,34 @@
 import os, datetime
+import time
 from abc import ABC, abstractmethod
-from functools import lru_cache
-from typing import Any, Dict, Union
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from io import BytesIO
+from typing import Any, BinaryIO, Callable, Dict, List, NamedTuple, Optional, Union
 
 import requests
+from redis.exceptions import RedisError
 
 from telebot import TeleBot
 
+from davai_s_nami_bot.celery_app import redis_client
+
 from . import events
 from . import crud
+from . import http_client
 
 from .helper.dsn_parameters import DSNParameters
+from .logger import get_logger
+
+
+# file name of in-memory image in multipart uploads (VK requires extension)
+IMAGE_FILE_NAME = "poster.jpg"
+# seconds to wait for post to one platform (see `BaseClient.post_timeout`)
+POST_TIMEOUT = 60
+# upload server of VK wall photos, shared by workers; refreshed earlier if VK rejects it
+VK_UPLOAD_URL_KEY = "vk:wall_upload_url:{user_id}:{group_id}"
+VK_UPLOAD_URL_TTL = 60 * 60
+
+log = get_logger(__file__)
 
 
 def format_text(text: str, style: str = None):
@@ -36,15 +54,33 @@ def format_text(text: str, style: str = None):
     return formatted
 
 
+class PostResult(NamedTuple):
+    client: str
+    result: Any
+    elapsed: float
+    error: Optional[BaseException] = None
+    timed_out: bool = False
+
+    @property
+    def ok(self):
+        return self.error is None and not self.timed_out
+
+
 class BaseClient(ABC):
     constants: Dict[str, Dict[str, Union[str, int]]]
     name: ""
     formatter_style = ""
+    post_timeout = POST_TIMEOUT
 
-    def send_post(self, event: events.Event, image_path: str, environ: str = "prod"):
+    def send_post(
+        self, event: events.Event, image: Union[str, bytes, None], environ: str = "prod"
+    ):
+        """
+        Post text of event with `image` (path or in-memory bytes) if it's given.
+        """
         text = format_text(event.post, style=self.formatter_style)
 
-        if image_path is None or '':
+        if not image:
             return self.send_text(
                 text=text,
                 **self.constants.get(environ, {}),
@@ -52,7 +88,7 @@ class BaseClient(ABC):
 
         return self.send_image(
             text=text,
-            image_path=image_path,
+            image=image,
             **self.constants.get(environ, {}),
         )
 
@@ -86,8 +122,10 @@ class Telegram(BaseClient):
         self.param = DSNParameters()
         self.channel_link = self.param.site_parameters('channel_link', last=1)
 
-    def send_post(self, event: events.Event, image_path: str, environ: str = "prod"):
-        message = super().send_post(event, image_path, environ=environ)
+    def send_post(
+        self, event: events.Event, image: Union[str, bytes, None], environ: str = "prod"
+    ):
+        message = super().send_post(event, image, environ=environ)
         #explored_date = datetime.datetime.now()
         crud.add_posted_event_to_dsn_bot(event, message.message_id)
 
@@ -114,9 +152,9 @@ class Telegram(BaseClient):
         )
 
     def send_image(
-        self, text: str, image_path: str, *, destination_id: Union[int, str]
+        self, text: str, image: Union[str, bytes], *, destination_id: Union[int, str]
     ):
-        with open(image_path, "rb") as image_obj:
+        with _open_image(image) as image_obj:
             message = self._client.send_photo(
                 chat_id=destination_id,
                 photo=image_obj,
@@ -181,12 +219,12 @@ class VKRequests(BaseClient):
     def send_image(
         self,
         text: str,
-        image_path: str,
+        image: Union[str, bytes],
         *,
         destination_id: Union[int, str],
     ):
         text = text.replace("@DavaiSNami", "@davaisnamispb")
-        with open(image_path, "rb") as image_obj:
+        with _open_image(image) as image_obj:
             attachments = self._upload_image_to_wall(destination_id, image_obj)
 
         return _requests_post(
@@ -202,19 +240,54 @@ class VKRequests(BaseClient):
         )
 
     def _upload_image_to_wall(self, group_id: Union[int, str], image_obj: Any):
-        upload_url = self._get_wall_upload_url(group_id)
+        upload_url, cached = self._get_wall_upload_url(group_id)
+
+        try:
+            upload_images = self._upload_image(upload_url, image_obj)
+        except requests.exceptions.RequestException:
+            if not cached:
+                raise
+            # cached upload server is expired, get new one and retry once
+            self._forget_wall_upload_url(group_id)
+            upload_url, _ = self._get_wall_upload_url(group_id)
+            image_obj.seek(0)
+            upload_images = self._upload_image(upload_url, image_obj)
+
+        return self._get_photo_attachments_str_wall(upload_images, group_id)
 
+    def _upload_image(self, upload_url: str, image_obj: Any) -> Dict[str, Any]:
         upload_images = _requests_post(
             url=upload_url,
             files={"file": image_obj},
             return_key=None,
         )
+        if "error" in upload_images or upload_images.get("photo") in (None, "", "[]"):
+            raise requests.exceptions.RequestException(
+                f"Image is rejected by upload server: {upload_images}"
+            )
 
-        return self._get_photo_attachments_str_wall(upload_images, group_id)
+        return upload_images
 
-    @lru_cache()
     def _get_wall_upload_url(self, group_id: Union[int, str]):
-        return _requests_post(
+        """
+        Upload server of wall photos from Redis or from VK.
+
+        Returns
+        -------
+        tuple
+            Upload url and flag if it's from cache.
+        """
+        key = self._wall_upload_url_key(group_id)
+        try:
+            upload_url = redis_client.get(key)
+        except RedisError as e:
+            log.warning(f"Failed to get VK upload url from Redis: {e}")
+            upload_url = None
+
+        if upload_url is not None:
+            return upload_url.decode(), True
+
+        upload_url = _requests_post(
             url=self.api_urls["upload_photo_wall"],
             data=dict(
                 group_id=group_id,
@@ -222,6 +295,23 @@ class VKRequests(BaseClient):
             ),
         )["upload_url"]
 
+        try:
+            redis_client.setex(key, VK_UPLOAD_URL_TTL, upload_url)
+        except RedisError as e:
+            log.warning(f"Failed to save VK upload url to Redis: {e}")
+
+        return upload_url, False
+
+    def _forget_wall_upload_url(self, group_id: Union[int, str]):
+        try:
+            redis_client.delete(self._wall_upload_url_key(group_id))
+        except RedisError as e:
+            log.warning(f"Failed to remove VK upload url from Redis: {e}")
+
+    def _wall_upload_url_key(self, group_id: Union[int, str]) -> str:
+        # upload server is issued for user of access token
+        return VK_UPLOAD_URL_KEY.format(user_id=self._access_params["user_id"], group_id=group_id)
+
     def _get_photo_attachments_str_wall(self, params: Dict[str, str], group_id):
         params["group_id"] = group_id
 
@@ -277,13 +367,79 @@ class Clients:
     def __init__(self):
         self._clients = [cls() for cls in BaseClient.__subclasses__()]
 
-    def send_post(self, *args, **kwargs):
-        for client in self._clients:
-            client.send_post(*args, **kwargs)
+    def send_post(self, *args, **kwargs) -> List[PostResult]:
+        """
+        Post to all clients concurrently.
+
+        Every client has its own timeout (`post_timeout`), failed or timed out
+        client doesn't affect others, so posting takes time of the slowest
+        client instead of sum of all.
+        """
+        if not self._clients:
+            return []
+
+        executor = ThreadPoolExecutor(
+            max_workers=len(self._clients), thread_name_prefix="send_post"
+        )
+        started = time.monotonic()
+        futures = [
+            (client, executor.submit(_timed_call, client.send_post, *args, **kwargs))
+            for client in self._clients
+        ]
+
+        results = []
+        try:
+            for client, future in futures:
+                timeout = max(started + client.post_timeout - time.monotonic(), 0)
+                try:
+                    result, elapsed = future.result(timeout=timeout)
+                except FuturesTimeoutError:
+                    future.cancel()
+                    results.append(PostResult(
+                        client.name, None, time.monotonic() - started, timed_out=True
+                    ))
+                except Exception as e:
+                    results.append(PostResult(client.name, None, time.monotonic() - started, e))
+                else:
+                    results.append(PostResult(client.name, result, elapsed))
+        finally:
+            # thread of timed out client can't be killed, don't wait for it
+            executor.shutdown(wait=False)
+
+        return results
+
+
+def log_post_result(result: PostResult):
+    if result.timed_out:
+        log.error(f"Post to {result.client}: timed out after {result.elapsed:.1f}s")
+    elif result.error is not None:
+        log.error(f"Post to {result.client}: failed after {result.elapsed:.1f}s: {result.error!r}")
+    else:
+        log.info(f"Post to {result.client}: done in {result.elapsed:.1f}s")
+
+
+def _timed_call(func: Callable[..., Any], *args, **kwargs):
+    start = time.monotonic()
+    result = func(*args, **kwargs)
+    return result, time.monotonic() - start
+
+
+def _open_image(image: Union[str, bytes]) -> BinaryIO:
+    """
+    File object of image path or of in-memory image (bytes, memoryview).
+    """
+    if isinstance(image, str):
+        return open(image, "rb")
+
+    image_obj = BytesIO(image)
+    image_obj.name = IMAGE_FILE_NAME
+    return image_obj
 
 
 def _requests_get(url, params: Dict[str, Any], return_key: str = "response"):
-    return _check_response(requests.get(url=url, params=params), return_key=return_key)
+    return _check_response(
+        http_client.get_session("vk").get(url=url, params=params), return_key=return_key
+    )
 
 
 def _requests_post(
@@ -294,7 +450,8 @@ def _requests_post(
     return_key: str = "response",
 ):
     return _check_response(
-        requests.post(url=url, data=data, json=json, files=files), return_key=return_key
+        http_client.get_session("vk").post(url=url, data=data, json=json, files=files),
+        return_key=return_key,
     )
 
 
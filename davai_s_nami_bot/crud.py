@@ -1,12 +1,17 @@
-from sqlalchemy import func, asc, desc, exc
+from sqlalchemy import func, asc, desc, exc, insert, select, tuple_, event as sa_event
+from sqlalchemy.orm import Session
 
 from .database.models import Events2Posts, EventsNotApproved, Exhibitions, DsnBotEvents, Place, ApiRequestLog
 from .database.database_orm import db_session
 
-from datetime import datetime, timedelta
-from typing import List
+import base64
+import binascii
+import json
+from datetime import datetime, time, timedelta
+from typing import List, Set
 
 from .events import Event
+from . import api_cache
 
 
 MODEL_REGISTRY = {
@@ -17,6 +22,38 @@ MODEL_REGISTRY = {
     'exhibitions': Exhibitions,
 }
 
+# size of IN (...) list of one query (bound parameters limit)
+EVENT_IDS_CHUNK_SIZE = 500
+
+
+def _changed_events(db, events):
+    """
+    Remember (id, from_date, to_date) of changed Events2Posts rows,
+    API cache is invalidated after commit.
+    """
+    db.info.setdefault('changed_events', []).extend(events)
+
+
+@sa_event.listens_for(Session, 'after_commit')
+def _invalidate_api_cache(db):
+    changed_events = db.info.pop('changed_events', None)
+    if changed_events:
+        api_cache.invalidate_events(changed_events)
+
+
+@sa_event.listens_for(Session, 'after_rollback')
+def _forget_changed_events(db):
+    db.info.pop('changed_events', None)
+
+
+def _day_start(value: datetime) -> datetime:
+    # range predicates instead of func.date(column) keep column indexes usable
+    return datetime.combine(value.date(), time.min)
+
+
+def _next_day_start(value: datetime) -> datetime:
+    return _day_start(value) + timedelta(days=1)
+
 
 def order_maping(model, order_by):
     if model == Place:
@@ -55,18 +92,42 @@ def order_maping(model, order_by):
 
 @db_session
 def get_events_by_date_and_category(db, params):
-    query = db.query(Events2Posts)\
+    """
+    Get published events by filters of `EventRequestParameters`.
+
+    Events are ordered by (from_date, id). Next page is requested either
+    by `page` (offset) or by `cursor` from `next_cursor` of previous
+    result, cursor (keyset) pages cost the same at any depth.
+
+    `total` of params is a way of `total_count` calculation:
+    'exact' - COUNT(*) by the same filter, 'approximate' - estimation of
+    query planner (exact count if database doesn't support it), 'none' -
+    no counting. By default total is exact for the first page and skipped
+    for cursor pages.
+
+    Returns
+    -------
+    dict
+        `events`, `total_count`, `next_cursor` (None for the last page)
+        and `request` (used parameters).
+    """
+    # id and from_date are needed for next_cursor
+    fields, columns = _fields_columns(Events2Posts, params.fields, required=('id', 'from_date'))
+    query = db.query(*columns)\
         .filter((Events2Posts.status == 'Posted') | Events2Posts.is_ready)
     dict_requests = {}
+    cursor = getattr(params, 'cursor', None)
+    total = getattr(params, 'total', None) or ('none' if cursor else 'exact')
+
     if params.ids:
         query = query.filter(Events2Posts.id.in_(params.ids))
         dict_requests['ids'] = params.ids
     else:
-        query = query.filter(func.date(Events2Posts.to_date) >= params.date_from.date())
+        query = query.filter(Events2Posts.to_date >= _day_start(params.date_from))
         dict_requests['date_from'] = params.date_from
 
         if params.date_to:
-            query = query.filter(func.date(Events2Posts.from_date) <= params.date_to.date())
+            query = query.filter(Events2Posts.from_date < _next_day_start(params.date_to))
             dict_requests['date_to'] = params.date_to
 
         if params.category:
@@ -77,32 +138,123 @@ def get_events_by_date_and_category(db, params):
             query = query.filter(Events2Posts.place_id.in_(params.place))
             dict_requests['place'] = params.place
 
-        query = query.order_by(Events2Posts.from_date.asc())
+    # keyset order of cursor pagination, for requests by ids too
+    query = query.order_by(Events2Posts.from_date.asc(), Events2Posts.id.asc())
 
-    total_count = query.count()
+    total_count = _count_query(db, query, total)
+    dict_requests['total'] = total
+
+    if cursor:
+        from_date, event_id = decode_cursor(cursor)
+        query = query.filter(
+            tuple_(Events2Posts.from_date, Events2Posts.id) > tuple_(from_date, event_id)
+        )
+        dict_requests['cursor'] = cursor
 
     if params.limit:
-        query = query.limit(params.limit)
+        # one extra row tells if there is the next page
+        query = query.limit(params.limit + 1)
         dict_requests['limit'] = params.limit
-        if params.page:
+        if params.page and not cursor:
             query = query.offset(params.page * params.limit)
             dict_requests['page'] = params.page
 
     events = query.all()
-    events = [
-        {field: getattr(event, field) for field in (params.fields or event.__table__.columns.keys())}
-        for event in events
-    ]
+
+    next_cursor = None
+    if params.limit and len(events) > params.limit:
+        events = events[:params.limit]
+        last_event = events[-1]
+        if last_event.from_date is not None:
+            next_cursor = encode_cursor(last_event.from_date, last_event.id)
+
+    events = _rows_to_dicts(events, fields)
     if params.fields:
         dict_requests['fields'] = params.fields
 
-    return {'events': events, 'total_count': total_count, 'request': dict_requests}
+    return {
+        'events': events,
+        'total_count': total_count,
+        'next_cursor': next_cursor,
+        'request': dict_requests,
+    }
+
+
+def _fields_columns(model, fields: List[str] = None, required=()):
+    """
+    Requested fields and columns for column-only query of `model`.
+
+    Only columns of model table are allowed as fields, `required` columns
+    are selected in addition to requested ones.
+
+    Raises
+    ------
+    ValueError
+        If some of fields isn't a column of model.
+    """
+    table_columns = model.__table__.columns
+    fields = list(fields or table_columns.keys())
+
+    unknown = [field for field in fields if field not in table_columns]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+    names = dict.fromkeys([*fields, *required])
+    return fields, [table_columns[name] for name in names]
+
+
+def _rows_to_dicts(rows, fields: List[str]) -> List[dict]:
+    return [{field: row._mapping[field] for field in fields} for row in rows]
+
+
+def encode_cursor(from_date: datetime, event_id: int) -> str:
+    """
+    Opaque cursor of keyset pagination by (from_date, id).
+    """
+    value = json.dumps([from_date.isoformat(), event_id])
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """
+    Decode cursor of `encode_cursor`.
+
+    Raises
+    ------
+    ValueError
+        If cursor is malformed.
+    """
+    try:
+        from_date, event_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(from_date), int(event_id)
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def _count_query(db, query, total: str):
+    if total == 'none':
+        return None
+
+    if total == 'approximate' and db.bind.dialect.name == 'postgresql':
+        statement = query.order_by(None).statement.compile(
+            dialect=db.bind.dialect,
+            compile_kwargs={'render_postcompile': True},
+        )
+        plan = db.connection().exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {statement.string}", statement.params
+        ).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    return query.order_by(None).count()
 
 
 @db_session
 def get_places(db, params):
     sort_order = order_maping(Place, params.order_by)
-    query = db.query(Place).order_by(sort_order)
+    fields, columns = _fields_columns(Place, params.fields)
+    query = db.query(*columns).order_by(sort_order)
 
     if params.ids:
         query = query.filter(Place.id.in_(params.ids))
@@ -115,12 +267,7 @@ def get_places(db, params):
             if params.page:
                 query = query.offset(params.page * params.limit)
 
-    places = query.all()
-    result = [
-        {field: getattr(place, field) for field in (params.fields or place.__table__.columns.keys())}
-        for place in places
-    ]
-    return result
+    return _rows_to_dicts(query.all(), fields)
 
 
 @db_session
@@ -150,30 +297,119 @@ def get_events_from_all_tables(db):
     return events
 
 
+@db_session
+def get_existing_event_ids(db, event_ids: List[str]) -> Set[str]:
+    """
+    Check which of event IDs are already saved.
+
+    Only `event_id` column is selected for candidates, so cost of
+    check depends on number of candidates, not on size of tables.
+
+    Parameters
+    ----------
+    event_ids : List[str]
+        Candidate event IDs (`event_id` field, not primary key).
+
+    Returns
+    -------
+    Set[str]
+        Event IDs found in Events2Posts or EventsNotApproved.
+    """
+    candidates = list(dict.fromkeys(event_id for event_id in event_ids if event_id))
+    existing = set()
+
+    for start in range(0, len(candidates), EVENT_IDS_CHUNK_SIZE):
+        chunk = candidates[start:start + EVENT_IDS_CHUNK_SIZE]
+        for table in (Events2Posts, EventsNotApproved):
+            existing.update(
+                db.scalars(select(table.event_id).where(table.event_id.in_(chunk)))
+            )
+
+    return existing
+
+
+@db_session
+def get_events_dates(db, ids: List[int]) -> List[tuple]:
+    """
+    (id, from_date, to_date) of Events2Posts rows for API cache invalidation.
+
+    IDs of missing (deleted) rows are returned with None dates, so all
+    cached events are invalidated for them.
+    """
+    dates = {}
+    for start in range(0, len(ids), EVENT_IDS_CHUNK_SIZE):
+        chunk = ids[start:start + EVENT_IDS_CHUNK_SIZE]
+        query = select(Events2Posts.id, Events2Posts.from_date, Events2Posts.to_date)
+        for event_id, from_date, to_date in db.execute(query.where(Events2Posts.id.in_(chunk))):
+            dates[event_id] = (event_id, from_date, to_date)
+
+    return [dates.get(event_id, (event_id, None, None)) for event_id in ids]
+
+
+@db_session
+def get_events_statistics(db) -> dict:
+    """
+    Count events of all tables with aggregate queries.
+
+    Returns
+    -------
+    dict
+        `total` - count of events in all tables,
+        `tables` - count of events by table name,
+        `statuses` - count of Events2Posts events by status.
+    """
+    tables = {
+        table.__tablename__: db.scalar(select(func.count()).select_from(table))
+        for table in (Events2Posts, EventsNotApproved)
+    }
+    statuses = dict(
+        db.execute(
+            select(Events2Posts.status, func.count()).group_by(Events2Posts.status)
+        ).all()
+    )
+
+    return {'total': sum(tables.values()), 'tables': tables, 'statuses': statuses}
+
+
+@db_session
+def count_events_by_status(db, status: str) -> int:
+    """
+    Count Events2Posts events with status.
+
+    Parameters
+    ----------
+    status : str
+        Status of events (e.g. 'ReadyToPost').
+
+    Returns
+    -------
+    int
+        Count of events.
+    """
+    return db.scalar(
+        select(func.count()).select_from(Events2Posts).where(Events2Posts.status == status)
+    )
+
+
 @db_session
 def get_approved_events(db, params):
-    query = db.query(Events2Posts)
+    fields, columns = _fields_columns(Events2Posts, params.fields)
+    query = db.query(*columns)
 
     if params.ids:
         query = query.filter(Events2Posts.id.in_(params.ids))
     else:
         if params.date_from:
-            query = query.filter(func.date(Events2Posts.from_date) <= params.date_from.date())
+            query = query.filter(Events2Posts.from_date < _next_day_start(params.date_from))
         if params.date_to:
-            query = query.filter(func.date(Events2Posts.to_date) <= params.date_to.date())
+            query = query.filter(Events2Posts.to_date < _next_day_start(params.date_to))
 
         if params.limit:
             query = query.limit(params.limit)
             if params.page:
                 query = query.offset(params.page * params.limit)
 
-    events = query.all()
-    result = [
-        {field: getattr(event, field) for field in (params.fields or event.__table__.columns.keys())}
-        for event in events
-    ]
-
-    return result
+    return _rows_to_dicts(query.all(), fields)
 
 
 @db_session
@@ -217,6 +453,32 @@ def get_event_to_post_now(db):
 
     return result
 
+@db_session
+def get_images_to_post(db, until: datetime) -> List[str]:
+    """
+    Images of ReadyToPost events scheduled to post from now to `until`.
+
+    Parameters
+    ----------
+    until : datetime
+        Upper bound of `post_date` (UTC).
+
+    Returns
+    -------
+    List[str]
+        Distinct image urls.
+    """
+    now = datetime.utcnow()
+    rows = db.execute(
+        select(Events2Posts.image).distinct().where(
+            Events2Posts.status == 'ReadyToPost',
+            Events2Posts.post_date.between(now - timedelta(minutes=5), until),
+            Events2Posts.image.isnot(None),
+        )
+    ).all()
+
+    return [row.image for row in rows if row.image]
+
 @db_session
 def get_scrape_it_events(db) -> List[Event]:
     events = db.query(Events2Posts).filter(Events2Posts.status == 'Scrape').all()
@@ -226,7 +488,9 @@ def get_scrape_it_events(db) -> List[Event]:
 
 @db_session
 def delete_events2post_by_event_id(db, event_ids: list[str]):
-    db.query(Events2Posts).filter(Events2Posts.event_id.in_(event_ids)).delete(synchronize_session=False)
+    query = db.query(Events2Posts).filter(Events2Posts.event_id.in_(event_ids))
+    _changed_events(db, query.with_entities(Events2Posts.id, Events2Posts.from_date, Events2Posts.to_date))
+    query.delete(synchronize_session=False)
 
 
 @db_session
@@ -236,6 +500,7 @@ def update_approved_event(db, event_id: int, new_event_data: dict):
         for key, value in new_event_data.items():
             if hasattr(event, key) and 'date' not in key:
                 setattr(event, key, value)
+        _changed_events(db, [(event.id, event.from_date, event.to_date)])
         return True
     except exc.NoResultFound:
         return None
@@ -243,28 +508,23 @@ def update_approved_event(db, event_id: int, new_event_data: dict):
 
 @db_session
 def get_not_approved_events(db, params):
-    query = db.query(EventsNotApproved)
+    fields, columns = _fields_columns(EventsNotApproved, params.fields)
+    query = db.query(*columns)
 
     if params.ids:
         query = query.filter(EventsNotApproved.id.in_(params.ids))
     else:
         if params.date_from:
-            query = query.filter(func.date(EventsNotApproved.explored_date) <= params.date_from.date())
+            query = query.filter(EventsNotApproved.explored_date < _next_day_start(params.date_from))
         if params.date_to:
-            query = query.filter(func.date(EventsNotApproved.explored_date) <= params.date_to.date())
+            query = query.filter(EventsNotApproved.explored_date < _next_day_start(params.date_to))
 
         if params.limit:
             query = query.limit(params.limit)
             if params.page:
                 query = query.offset(params.page * params.limit)
 
-    events = query.all()
-    result = [
-        {field: getattr(event, field) for field in (params.fields or event.__table__.columns.keys())}
-        for event in events
-    ]
-
-    return result
+    return _rows_to_dicts(query.all(), fields)
 
 
 @db_session
@@ -276,9 +536,8 @@ def update_not_approved_events_set_approved(db, event_ids=[]):
 
 @db_session
 def get_exhibitions(db):
-    today = datetime.today()
     exhibitions = db.query(Exhibitions).filter(
-        func.date(Exhibitions.date_before) >= today,
+        Exhibitions.date_before >= _day_start(datetime.today()),
     )
 
     result = [
@@ -312,15 +571,46 @@ def create_event(db, event_data: dict, model):
     """
     event = model(**event_data)
     db.add(event)
+    if model is Events2Posts:
+        db.flush()
+        _changed_events(db, [(event.id, event.from_date, event.to_date)])
     db.commit()
     db.refresh(event)
     return {"id": event.id} # or make Event model
 
 
-def add_events_to_post(events: List[Event], explored_date: datetime, queue_increase=2):
+@db_session
+def bulk_create_events(db, rows: List[dict], model) -> List[int]:
+    """
+    Make new rows in DB in one transaction by batched INSERT ... RETURNING id.
+
+    Parameters
+    ----------
+    db : db
+        DB session of SQLAlchemy.
+
+    rows : List[dict]
+        Data for making rows, keys which aren't columns of `model` are skipped.
+
+    model : class
+        model SQLAlchemy.
+
+    Returns
+    -------
+    List[int]
+        IDs of inserted rows in order of `rows`.
+    """
+    return _bulk_insert(db, rows, model)
+
+
+@db_session
+def add_events_to_post(db, events: List[Event], explored_date: datetime, queue_increase=2):
     """
     Make new rows in table Events2Posts for posting.
 
+    Queue values continue last queue value of ReadyToPost events and are
+    assigned in the same transaction as insert.
+
     Parameters
     ----------
     events : List[Event]
@@ -337,30 +627,19 @@ def add_events_to_post(events: List[Event], explored_date: datetime, queue_incre
     List[int]
         List of added events IDs.
     """
-    value = int(get_last_queue_value())
-
-    def func(value=value, queue_increase=queue_increase):
-        while True:
-            value += queue_increase
-            yield value
-
-    queue_value_gen = func()
-
-    list_inserted_ids = []
-    for event in events:
+    last_queue_value = int(_last_queue_value(db))
 
+    rows = []
+    for number, event in enumerate(events, start=1):
         event_dict = event.to_dict()
         event_dict.update({
             'status': 'ReadyToPost',
-            'queue': next(queue_value_gen),
+            'queue': last_queue_value + number * queue_increase,
             'explored_date': explored_date
         })
+        rows.append(event_dict)
 
-        new_event = create_event(event_dict, Events2Posts)
-        if new_event and 'id' in new_event:
-            list_inserted_ids.append(new_event['id'])
-
-    return list_inserted_ids
+    return _bulk_insert(db, rows, Events2Posts)
 
 
 def add_events(events: List[Event], explored_date: datetime, table: str = "events_eventsnotapprovednew"):
@@ -387,23 +666,41 @@ def add_events(events: List[Event], explored_date: datetime, table: str = "event
     if not model:
         raise ValueError(f"Неизвестная таблица: {table}")
 
-    list_inserted_ids = []
+    rows = []
     for event in events:
-        # Преобразуем Event в словарь
         event_dict = event.to_dict()
-
-        # Добавляем дополнительные поля
         event_dict.update({
             'approved': False,
             'explored_date': explored_date,
         })
+        rows.append(event_dict)
+
+    return bulk_create_events(rows, model)
+
+
+def _bulk_insert(db, rows: List[dict], model) -> List[int]:
+    if not rows:
+        return []
+
+    columns = set(model.__table__.columns.keys())
+    rows = [
+        {
+            key: value for key, value in row.items()
+            # empty primary key is generated by database
+            if key in columns and not (key == 'id' and value is None)
+        }
+        for row in rows
+    ]
+
+    statement = insert(model).returning(model.id, sort_by_parameter_order=True)
+    ids = list(db.scalars(statement, rows))
 
-        # Создаем новую запись в базе данных
-        new_event = create_event(event_dict, model)
-        if new_event and 'id' in new_event:
-            list_inserted_ids.append(new_event['id'])
+    if model is Events2Posts:
+        _changed_events(db, [
+            (row_id, row.get('from_date'), row.get('to_date')) for row_id, row in zip(ids, rows)
+        ])
 
-    return list_inserted_ids
+    return ids
 
 
 @db_session
@@ -425,15 +722,22 @@ def set_status(db: object, event_id: str, status: str) -> None:
     event = db.query(Events2Posts).filter_by(event_id=event_id).first()
     if event:
         event.status = status
+        _changed_events(db, [(event.id, event.from_date, event.to_date)])
 
 
 
 @db_session
 def set_post_url(db: object, event_id: str, post_url: str) -> None:
-    db.query(Events2Posts).filter_by(event_id=event_id).update({"post_url": post_url})
+    query = db.query(Events2Posts).filter_by(event_id=event_id)
+    _changed_events(db, query.with_entities(Events2Posts.id, Events2Posts.from_date, Events2Posts.to_date))
+    query.update({"post_url": post_url})
 
 @db_session
 def get_last_queue_value(db) -> int:
+    return _last_queue_value(db)
+
+
+def _last_queue_value(db) -> int:
     result = db.query(Events2Posts.queue).filter_by(status='ReadyToPost').order_by(Events2Posts.queue.desc()).first()
     last_queue_value = result[0] if result and result[0] is not None else 0
     return last_queue_value
@@ -444,6 +748,20 @@ def save_api_request_log(db, request_info: dict):
     db.add(api_request_log)
 
 
+@db_session
+def save_api_request_logs(db, requests_info: List[dict]):
+    """
+    Save API request logs by one multi-row insert.
+
+    Parameters
+    ----------
+    requests_info : List[dict]
+        Columns of ApiRequestLog rows.
+    """
+    if requests_info:
+        db.execute(insert(ApiRequestLog), requests_info)
+
+
 ######## DSN BOT ########
 ####––––––START––––––####
 
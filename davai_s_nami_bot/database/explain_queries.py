@@ -0,0 +1,84 @@
+"""
+Print EXPLAIN plans of crud queries.
+
+Every crud read function is called with sample parameters, SQL statements
+are captured from engine and explained with the same parameters:
+
+    DSN_DATABASE_URL=postgresql://... python -m davai_s_nami_bot.database.explain_queries
+"""
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from .database_orm import engine
+from .. import crud
+from ..pydantic_models import EventRequestParameters, PlaceRequestParameters
+
+
+def crud_queries():
+    week_later = datetime.utcnow() + timedelta(days=7)
+
+    return {
+        "get_events_by_date_and_category": lambda: crud.get_events_by_date_and_category(
+            EventRequestParameters(date_to=week_later, category=[1], place=[1])
+        ),
+        "get_approved_events": lambda: crud.get_approved_events(
+            EventRequestParameters(date_to=week_later)
+        ),
+        "get_not_approved_events": lambda: crud.get_not_approved_events(
+            EventRequestParameters(date_to=week_later)
+        ),
+        "get_places": lambda: crud.get_places(PlaceRequestParameters()),
+        "get_ready_to_post_events": crud.get_ready_to_post_events,
+        "get_event_to_post_now": crud.get_event_to_post_now,
+        "get_scrape_it_events": crud.get_scrape_it_events,
+        "get_last_queue_value": crud.get_last_queue_value,
+        "get_exhibitions": crud.get_exhibitions,
+        "get_existing_event_ids": lambda: crud.get_existing_event_ids(["event_id"]),
+        "get_events_statistics": crud.get_events_statistics,
+        "count_events_by_status": lambda: crud.count_events_by_status("ReadyToPost"),
+        "search_events_by_string": lambda: crud.search_events_by_string("концерт", 10),
+    }
+
+
+def capture_statements(query):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        query()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    return statements
+
+
+def explain(statement, parameters):
+    prefix = "EXPLAIN QUERY PLAN" if engine.dialect.name == "sqlite" else "EXPLAIN"
+
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"{prefix} {statement}", parameters).all()
+
+    return "\n".join(" ".join(str(value) for value in row) for row in rows)
+
+
+def main(names=None):
+    for name, query in crud_queries().items():
+        if names and name not in names:
+            continue
+
+        for statement, parameters in capture_statements(query):
+            print(f"=== {name} ===")
+            print(statement)
+            print(f"parameters: {parameters}")
+            print(explain(statement, parameters))
+            print()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
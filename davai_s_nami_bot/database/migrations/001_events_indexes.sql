@@ -0,0 +1,34 @@
+-- Indexes for hot filters of crud queries (PostgreSQL).
+-- CONCURRENTLY doesn't lock tables for writes, so every statement
+-- must be run outside of transaction, e.g. `psql -f 001_events_indexes.sql`.
+
+-- get_event_to_post_now: status = 'ReadyToPost' AND post_date BETWEEN ...
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_events2post_status_post_date
+    ON events_events2post (status, post_date);
+
+-- get_last_queue_value: status = 'ReadyToPost' ORDER BY queue DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_events2post_status_queue
+    ON events_events2post (status, queue);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_events2post_main_category_id
+    ON events_events2post (main_category_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_events2post_place_id
+    ON events_events2post (place_id);
+
+-- get_events_by_date_and_category: (status = 'Posted' OR is_ready) AND to_date >= ... AND from_date < ...
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_events2post_published_dates
+    ON events_events2post (to_date, from_date)
+    WHERE status = 'Posted' OR is_ready;
+
+-- get_existing_event_ids
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_eventsnotapproved_event_id
+    ON events_eventsnotapprovednew (event_id);
+
+-- get_not_approved_events: explored_date < ...
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_eventsnotapproved_explored_date
+    ON events_eventsnotapprovednew (explored_date);
+
+-- get_exhibitions: date_before >= ...
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_exhibitions_date_before
+    ON exhibitions (date_before);
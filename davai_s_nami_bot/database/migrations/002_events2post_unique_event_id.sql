@@ -0,0 +1,17 @@
+-- Unique event_id of events_events2post (PostgreSQL).
+-- Run outside of transaction, e.g. `psql -f 002_events2post_unique_event_id.sql`.
+--
+-- Index creation fails if table already has duplicates, find them with:
+--
+--     SELECT event_id, array_agg(id ORDER BY id)
+--     FROM events_events2post
+--     GROUP BY event_id
+--     HAVING count(*) > 1;
+--
+-- and remove extra rows by hand. A failed CONCURRENTLY build leaves
+-- INVALID index, drop it before the next attempt:
+--
+--     DROP INDEX CONCURRENTLY IF EXISTS ix_events2post_event_id;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_events2post_event_id
+    ON events_events2post (event_id);
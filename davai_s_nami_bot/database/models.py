@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -43,6 +43,20 @@ class Events2Posts(Base):
     category = Column(String, nullable=True)
     main_category_id = Column(Integer, nullable=True)
 
+    # keep in sync with database/migrations (event_id is unique there)
+    __table_args__ = (
+        Index('ix_events2post_status_post_date', 'status', 'post_date'),
+        Index('ix_events2post_status_queue', 'status', 'queue'),
+        Index('ix_events2post_event_id', 'event_id', unique=True),
+        Index('ix_events2post_main_category_id', 'main_category_id'),
+        Index('ix_events2post_place_id', 'place_id'),
+        Index(
+            'ix_events2post_published_dates', 'to_date', 'from_date',
+            postgresql_where=text("status = 'Posted' OR is_ready"),
+            sqlite_where=text("status = 'Posted' OR is_ready"),
+        ),
+    )
+
 
 class EventsNotApproved(Base):
     __tablename__ = 'events_eventsnotapprovednew'
@@ -62,6 +76,11 @@ class EventsNotApproved(Base):
     to_date = Column(DateTime, nullable=True)
     category = Column(String, nullable=True)
 
+    __table_args__ = (
+        Index('ix_eventsnotapproved_event_id', 'event_id'),
+        Index('ix_eventsnotapproved_explored_date', 'explored_date'),
+    )
+
 
 class Exhibitions(Base):
     __tablename__ = 'exhibitions'
@@ -71,6 +90,10 @@ class Exhibitions(Base):
     date_before = Column(DateTime, nullable=True)
     price = Column(String, nullable=True)
 
+    __table_args__ = (
+        Index('ix_exhibitions_date_before', 'date_before'),
+    )
+
 
 class DsnBotEvents(Base):
     __tablename__ = 'bot_events'
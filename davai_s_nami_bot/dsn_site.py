@@ -37,27 +37,24 @@ def next_event_to_channel():
 
 
 def get_new_events(events: List[Event]) -> List[Event]:
-    all_events = crud.get_events_from_all_tables()
-    
-    # Получаем множество event_id из всех событий
-    existing_ids = set(event.event_id for event in all_events)
-    
-    # Фильтруем события, оставляя только те, которых нет в базе
-    new_events = [event for event in events if event.event_id not in existing_ids]
+    existing_ids = crud.get_existing_event_ids([event.event_id for event in events])
+
+    new_events = []
+    for event in events:
+        if event.event_id not in existing_ids:
+            new_events.append(event)
+            # also skip repeated events of the same batch
+            existing_ids.add(event.event_id)
 
     return new_events
 
 
 def not_published_count():
-    events = crud.get_ready_to_post_events()
-    
-    return len(events)
+    return crud.count_events_by_status('ReadyToPost')
 
 
 def events_count():
-    # Get events from all tables using CRUD
-    all_events = crud.get_events_from_all_tables()
-    return len(all_events)
+    return crud.get_events_statistics()['total']
 
 
 columns_for_posting_time = ["post_date", "title", "event_id"]
@@ -1,5 +1,15 @@
+import json
 import os
+import time
+from typing import Dict
+from uuid import uuid4
+
 import requests
+from redis.exceptions import WatchError
+
+from davai_s_nami_bot.celery_app import redis_client
+
+from . import api_cache, http_client
 
 
 BASE_URL = os.environ.get("BASE_URL")
@@ -11,28 +21,141 @@ FILL_EMPTY_POST_TIME_URL = BASE_URL + "events/fill_empty_post_time/"
 PARAMETERS_FOR_CHANNEL = BASE_URL + "events/parameters_for_channel/"
 PLACE_ADDRESS = BASE_URL + "place/place_address/"
 MAKE_POST = BASE_URL + "events/make_post/"
-CSRFTOKEN = None
-SESSION_ID = None
-
-def create_session():
-    global CSRFTOKEN
-    global SESSION_ID
-
-    login_url = BASE_URL + "login/"
+LOGIN_URL = BASE_URL + "login/"
+
+COOKIES_KEY = "dsn_site:cookies"
+COOKIES_TTL = 60 * 60 * 24
+LOGIN_LOCK_KEY = "dsn_site:login_lock"
+LOGIN_LOCK_TIMEOUT = 30
+
+# admin endpoints change data by GET and may run long: no read timeout and
+# no retries of sent requests (see `http_client.get_session`)
+DSN_SITE_TIMEOUT = (5, None)
+
+
+class DSNSiteSession:
+    """
+    Authenticated session of DSN site shared between workers.
+
+    Login cookies are kept in Redis, so a worker logs in only when there are
+    no cookies yet or the site rejected them (401/403 or redirect to login
+    page). Requests go through pooled `http_client` session.
+    """
+
+    def __init__(self):
+        self._cookies = None
+
+    def get(self, url: str) -> requests.Response:
+        cookies = self.cookies
+        response = self._get(url, cookies)
+
+        if _is_unauthorized(response):
+            self.login(expired=cookies)
+            response = self._get(url, self.cookies)
+
+        return response
+
+    @property
+    def cookies(self) -> Dict[str, str]:
+        if self._cookies is None:
+            cached_cookies = redis_client.get(COOKIES_KEY)
+            if cached_cookies:
+                self._cookies = json.loads(cached_cookies)
+            else:
+                self.login()
+
+        return self._cookies
+
+    def login(self, expired: Dict[str, str] = None):
+        """
+        Login to DSN site and share cookies with other workers. Cookies
+        `expired` are replaced only if other worker hasn't done it yet.
+        """
+        # lock is released only by its owner: login may outlive LOGIN_LOCK_TIMEOUT
+        token = uuid4().hex
+        if not redis_client.set(LOGIN_LOCK_KEY, token, nx=True, ex=LOGIN_LOCK_TIMEOUT):
+            cookies = self._wait_for_login(expired)
+            if cookies:
+                self._cookies = cookies
+                return
+
+        try:
+            self._cookies = _login()
+            redis_client.setex(COOKIES_KEY, COOKIES_TTL, json.dumps(self._cookies))
+        finally:
+            _release_login_lock(token)
+
+    def _wait_for_login(self, expired):
+        start_time = time.time()
+        while time.time() - start_time < LOGIN_LOCK_TIMEOUT:
+            cached_cookies = redis_client.get(COOKIES_KEY)
+            if cached_cookies and json.loads(cached_cookies) != expired:
+                return json.loads(cached_cookies)
+            time.sleep(0.5)
+
+        return None
+
+    def _get(self, url, cookies):
+        return _dsn_site_session().get(
+            url, headers=_headers(), cookies=cookies
+        )
+
+
+def _login() -> Dict[str, str]:
     login_data = dict(
         username=os.environ.get("DSN_USERNAME"),
         password=os.environ.get("DSN_PASSWORD"),
         next=BASE_URL,
     )
-    session = requests.session()
-    session.get(login_url, headers=_headers())
+    session = _dsn_site_session()
+    session.cookies.clear()
+
+    session.get(LOGIN_URL, headers=_headers())
+    csrftoken = session.cookies.get("csrftoken")
+
+    login_data["csrfmiddlewaretoken"] = csrftoken
+    session.post(LOGIN_URL, data=login_data, headers=_headers())
+    session_id = session.cookies.get("sessionid")
+
+    # cookies are passed explicitly with every request
+    session.cookies.clear()
+
+    if not session_id:
+        raise requests.exceptions.RequestException("Login to DSN site failed")
+
+    return {"csrftoken": csrftoken, "sessionid": session_id}
+
+
+def _release_login_lock(token: str):
+    with redis_client.pipeline() as pipe:
+        try:
+            pipe.watch(LOGIN_LOCK_KEY)
+            if pipe.get(LOGIN_LOCK_KEY) != token.encode():
+                return
+
+            pipe.multi()
+            pipe.delete(LOGIN_LOCK_KEY)
+            pipe.execute()
+        except WatchError:
+            # lock expired and was taken by other worker meanwhile
+            pass
+
+
+def _dsn_site_session() -> requests.Session:
+    return http_client.get_session("dsn_site", timeout=DSN_SITE_TIMEOUT, retry_reads=False)
+
+
+def _is_unauthorized(response: requests.Response) -> bool:
+    return response.status_code in (401, 403) or (
+        bool(response.history) and response.url.startswith(LOGIN_URL)
+    )
+
+
+dsn_site_session = DSNSiteSession()
 
-    CSRFTOKEN = session.cookies["csrftoken"]
 
-    login_data["csrfmiddlewaretoken"] = CSRFTOKEN
-    response = session.post(login_url, data=login_data, headers=_headers())
-    SESSION_ID = session.cookies["sessionid"]
-    #assert response.ok
+def create_session():
+    dsn_site_session.login()
 
 
 def _headers():
@@ -40,24 +163,25 @@ def _headers():
 
 
 def _current_session_get(url):
-    session = requests.session()
-    if CSRFTOKEN is None or SESSION_ID is None: create_session()
+    return dsn_site_session.get(url)
 
-    session.cookies["csrfmiddlewaretoken"] = CSRFTOKEN
-    session.cookies["sessionid"] = SESSION_ID
-    return session.get(url, headers=_headers())
+def _change_events(url):
+    # site changes events in bulk, cached API responses of all events are invalid
+    response = _current_session_get(url=url)
+    api_cache.invalidate_events()
+    return response
 
 def check_event_status():
-    _current_session_get(url=CHECK_EVENT_STATUS_URL)
+    _change_events(CHECK_EVENT_STATUS_URL)
 
 def move_approved():
-    _current_session_get(url=MOVE_APPROVED_URL)
+    _change_events(MOVE_APPROVED_URL)
 
 def remove_old():
-    _current_session_get(url=REMOVE_OLD_URL)
+    _change_events(REMOVE_OLD_URL)
 
 def fill_empty_post_time():
-    _current_session_get(url=FILL_EMPTY_POST_TIME_URL)
+    _change_events(FILL_EMPTY_POST_TIME_URL)
 
 def parameter_for_dsn_channel(parameters={}):
     query_parameters = '?'
@@ -75,6 +199,4 @@ def make_post_text(ids):
     else:
         ids_string = ids
     url = f"{MAKE_POST}{ids_string}"
-    _current_session_get(url=url)
-
-
+    _change_events(url)
@@ -1,13 +1,16 @@
-import time
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from datetime import date, datetime, timedelta
+from functools import partial
 
-from typing import Any, Callable, Dict, List, NamedTuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple
 
 import escraper
 from escraper.parsers import ALL_EVENT_TAGS, Radario, Timepad, Ticketscloud, VK, QTickets, MTS, Culture
 
-from . import utils
+from . import http_cache, scraping, sync_state, utils
+from .datetime_utils import STRFTIME
 from .logger import catch_exceptions
 
 from .dsn_site_session import place_address
@@ -19,6 +22,8 @@ STARTS_AT_MIN = "{year_month_day}T10:00:00"
 STARTS_AT_MAX = "{year_month_day}T23:59:00"
 
 MAX_NEXT_DAYS = 30
+TIMEPAD_REQUESTS_PER_SECOND = 2
+TIMEPAD_PARALLEL_PAGES = 4
 two_days = timedelta(days=2)
 
 ## PARSERS
@@ -30,6 +35,15 @@ qt_parser = QTickets()
 mts_parser = MTS()
 culture_parser = Culture()
 
+timepad_rate_limiter = scraping.RateLimiter(rate=TIMEPAD_REQUESTS_PER_SECOND)
+
+for _source, _parser in {
+    'timepad': timepad_parser, 'radario': radario_parser,
+    'ticketscloud': ticketscloud_parser, 'vk': vk_parser,
+    'qtickets': qt_parser, 'mts': mts_parser, 'culture': culture_parser,
+}.items():
+    http_cache.install_to_parser(_parser, _source)
+
 PARSER_URLS = {
     'timepad.ru': timepad_parser, 'vk.': vk_parser,
     'ticketscloud.': ticketscloud_parser, 'radario.ru': radario_parser,
@@ -430,27 +444,26 @@ class Event:
         return cls(**event_dict)
 
 
-def not_approved_organization_filter(events: List[Event]):
+def not_approved_organization_filter(events: Iterable[Event]) -> List[Event]:
     """
     Remove events:
     - with bad-keywords
     - with too long duration (more than two days),
     """
-    good_events = list()
+    return [event for event in events if is_good_event(event)]
 
-    for event in events:
-        if (
-            event is None
-            or (
-                event.to_date is not None and event.to_date - event.from_date > two_days
-            )
-            or event.image is None
-        ):
-            continue
 
-        good_events.append(event)
-
-    return good_events
+def is_good_event(event: Event) -> bool:
+    """
+    Predicate of `not_approved_organization_filter` for streaming events.
+    """
+    return not (
+        event is None
+        or (
+            event.to_date is not None and event.to_date - event.from_date > two_days
+        )
+        or event.image is None
+    )
 
 
 @catch_exceptions()
@@ -489,55 +502,111 @@ def timepad_approved_organizations(days: int) -> List[Event]:
 
 
 def from_not_approved_organizations(days: int) -> List[Event]:
-    events = []
+    """
+    Getting events from all other sources (see `stream_from_not_approved_organizations`).
+    """
+    return list(stream_from_not_approved_organizations(days))
 
-    function_list = [
-        timepad_others_organizations,
-        radario_others_organizations,
-        ticketscloud_others_organizations,
-    ]
 
-    for func in function_list:
-        try:
-            events += func(days)
-        except Exception as e:
-            print(f"An error occurred in {func.__name__}: {e}")
+def stream_from_not_approved_organizations(
+    days: int, incremental: bool = False, results: bool = False
+) -> Iterator[Event]:
+    """
+    Getting events from all other sources concurrently, events are yielded
+    while other pages and sources are still downloading (see
+    `scraping.stream_concurrently`, also for `results`).
+
+    With `incremental` every source is scraped by `incremental_stream`, its
+    `sync_state.Checkpoint` is `sync` of source result.
+    """
+    return scraping.stream_concurrently(
+        not_approved_organizations_streams(days, incremental=incremental),
+        results=results,
+    )
+
+
+def incremental_stream(source: str, days: int) -> Iterator[Event]:
+    """
+    Stream events of other organizations from `source`, requesting only days
+    which weren't covered by previous sync (where site allows it) and skipping
+    events which were already seen unchanged (see `sync_state`).
+    Returns `sync_state.Checkpoint`, consumer saves it after the events are
+    inserted.
+    """
+    window = sync_state.plan_window(source, days)
+    stream = others_organizations_streams[source](days, window.skip_days, window.synced_at)
+
+    hashes = {}
+    yield from sync_state.only_changed(source, stream, hashes, skip_known=not window.full)
+
+    return sync_state.Checkpoint(window, hashes)
+
+
+def not_approved_organizations_schedule(days: int) -> Dict[str, int]:
+    """
+    Sources of other organizations for today with number of days to scrape,
+    some sources are scraped only on specific weekdays.
+    """
+    schedule = {"timepad": days, "radario": days, "ticketscloud": days}
 
     weekday = date.today().weekday()
     if weekday == 6:
-        try:
-            events += vk_others_organizations(days)
-        except Exception as e:
-            print(f"An error occurred in vk_others_organizations: {e}")
+        schedule["vk"] = days
     elif weekday % 2 == 1:
-        try:
-            events += qtickets_others_organizations(days*2)
-        except Exception as e:
-            print(f"An error occurred in qtickets_others_organizations: {e}")
+        schedule["qtickets"] = days * 2
 
     if weekday == 0 or weekday == 4:
-        try:
-            events += mts_others_organization(days)
-        except Exception as e:
-            print(f"An error occurred in mts_others_organization: {e}")
+        schedule["mts"] = days
     elif weekday == 2 or weekday == 5:
-        try:
-            events += culture_others_organizations(days)
-        except Exception as e:
-            print(f"An error occurred in culture_organizations: {e}")
+        schedule["culture"] = days
 
-    return events
+    return schedule
 
 
-def timepad_others_organizations(days: int) -> List[Event]:
-    timepad_others_params = timepad_request_params()
-    return get_timepad_events(
-        days,
-        timepad_others_params,
-        events_filter=not_approved_organization_filter,
+def not_approved_organizations_streams(
+    days: int, incremental: bool = False
+) -> Dict[str, Callable[[], Iterator[Event]]]:
+    if incremental:
+        return {
+            source: partial(incremental_stream, source, source_days)
+            for source, source_days in not_approved_organizations_schedule(days).items()
+        }
+
+    return {
+        source: partial(others_organizations_streams[source], source_days)
+        for source, source_days in not_approved_organizations_schedule(days).items()
+    }
+
+
+def iter_timepad_others_organizations(
+    days: int, skip_days: int = 0, created_at_min: datetime = None
+) -> Iterator[Event]:
+    return filter(
+        is_good_event,
+        iter_timepad_events(
+            days,
+            timepad_request_params(),
+            skip_days=skip_days,
+            created_at_min=created_at_min,
+        ),
     )
 
 
+def timepad_others_window(
+    days: int, skip_days: int = 0, changed_since: datetime = None
+) -> Iterator[Event]:
+    """
+    New days at the window edge plus events of already covered days
+    created since previous sync.
+    """
+    edge = iter_timepad_others_organizations(days, skip_days=skip_days)
+    if skip_days == 0 or changed_since is None:
+        return edge
+
+    changed = iter_timepad_others_organizations(skip_days - 1, created_at_min=changed_since)
+    return chain(edge, changed)
+
+
 def timepad_request_params(approved: bool = False) -> Dict:
     timepad_params = dsn_parameters.read_param('timepad')
 
@@ -572,8 +641,15 @@ def timepad_request_params(approved: bool = False) -> Dict:
     return timepad_others_params
 
 
-def radario_others_organizations(days: int) -> List[Event]:
-    return get_radario_events(days)
+def radario_others_organizations(days: int, skip_days: int = 0) -> List[Event]:
+    return get_radario_events(days, skip_days=skip_days)
+
+
+def radario_others_window(
+    days: int, skip_days: int = 0, changed_since: datetime = None
+) -> Iterator[Event]:
+    # radario can't filter by creation time, covered days are updated by full sync
+    return iter(radario_others_organizations(days, skip_days=skip_days))
 
 
 def ticketscloud_others_organizations(days: int) -> List[Event]:
@@ -605,6 +681,27 @@ def get_timepad_events(
     """
     Getting events.
     """
+    new_events = list(iter_timepad_events(days, request_params, with_online))
+
+    if events_filter:
+        new_events = events_filter(new_events)
+
+    return new_events
+
+
+def iter_timepad_events(
+    days: int,
+    request_params: Dict[str, Any] = None,
+    with_online: bool = False,
+    skip_days: int = 0,
+    created_at_min: datetime = None,
+) -> Iterator[Event]:
+    """
+    Getting events page by page.
+
+    `skip_days` first days are not requested, with `created_at_min` only
+    events created after it are requested (see `incremental_stream`).
+    """
     if days > MAX_NEXT_DAYS:
         raise ValueError(
             f"Too much days for getting events: {days}."
@@ -616,7 +713,7 @@ def get_timepad_events(
         request_params = timepad_request_params()
 
     request_params["starts_at_min"] = STARTS_AT_MIN.format(
-        year_month_day=today.strftime("%Y-%m-%d")
+        year_month_day=(today + timedelta(days=skip_days)).strftime("%Y-%m-%d")
     )
     request_params["starts_at_max"] = STARTS_AT_MAX.format(
         year_month_day=(today + timedelta(days=days)).strftime("%Y-%m-%d")
@@ -625,37 +722,54 @@ def get_timepad_events(
     if with_online:
         request_params["cities"] += ", Без города"
 
-    # for getting all events (max limit 100)
+    if created_at_min is not None:
+        request_params["created_at_min"] = created_at_min.strftime(STRFTIME)
+
     event_ids = set()
-    new_events = list()
-    count = 0
-    new_count = 1
-    while new_count > 0:
-        request_params["skip"] = count
-
-        _new = _get_events(
-            timepad_parser,
-            request_params=request_params,
-            tags=ALL_EVENT_TAGS,
-        )
-        new = [i for i in _new if i.event_id not in event_ids]
-        event_ids.update([i.event_id for i in _new])
+    page_size = request_params["limit"]
+    skip = 0
+    parallel_pages = 1
+
+    # Pages are requested in batches of growing size (up to
+    # TIMEPAD_PARALLEL_PAGES), request rate is limited by `timepad_rate_limiter`.
+    # Stop on the first page without new events.
+    with ThreadPoolExecutor(max_workers=TIMEPAD_PARALLEL_PAGES) as executor:
+        while True:
+            pages = executor.map(
+                partial(_get_timepad_page, request_params),
+                [skip + i * page_size for i in range(parallel_pages)],
+            )
 
-        new_count = len(new)
+            exhausted = False
+            for page in pages:
+                new = [i for i in page if i.event_id not in event_ids]
+                event_ids.update([i.event_id for i in page])
+                yield from new
 
-        new_events += new
-        count += new_count
+                if not new:
+                    exhausted = True
 
-        time.sleep(1)
+            if exhausted:
+                break
 
-    if events_filter:
-        new_events = events_filter(new_events)
+            skip += parallel_pages * page_size
+            parallel_pages = min(parallel_pages * 2, TIMEPAD_PARALLEL_PAGES)
 
-    return new_events
+
+def _get_timepad_page(request_params: Dict[str, Any], skip: int) -> List[Event]:
+    timepad_rate_limiter.acquire()
+
+    return _get_events(
+        timepad_parser,
+        request_params={**request_params, "skip": skip},
+        tags=ALL_EVENT_TAGS,
+    )
 
 
 def get_radario_events(
-    days: int, events_filter: Callable[[List[Event]], List[Event]] = None
+    days: int,
+    events_filter: Callable[[List[Event]], List[Event]] = None,
+    skip_days: int = 0,
 ) -> List[Event]:
     category = [
         "concert",
@@ -666,7 +780,7 @@ def get_radario_events(
         "show",
     ]
     today = date.today()
-    date_from = today.strftime(Radario.DATETIME_STRF)
+    date_from = (today + timedelta(days=skip_days)).strftime(Radario.DATETIME_STRF)
     date_to = (today + timedelta(days=days)).strftime(Radario.DATETIME_STRF)
 
     radario_city = 'spb'
@@ -795,14 +909,39 @@ def get_culture_events(
     return new_events
 
 
-escraper_sites = {
-    'timepad':      get_timepad_events,
-    'radario':      get_radario_events,
-    'ticketscloud': get_ticketscloud_events,
-    'vk':           get_vk_events,
-    'qtickets':     get_qtickets_events,
-    'mts':          get_mts_events,
-    'culture':      get_culture_events
+def _streamed(get_events: Callable[[int], List[Event]]) -> Callable[..., Iterator[Event]]:
+    """
+    Streaming wrapper for fetchers without pagination (one request per call).
+    Window arguments of `others_organizations_streams` are ignored, all `days`
+    are requested.
+    """
+    def stream(days: int, skip_days: int = 0, changed_since: datetime = None) -> Iterator[Event]:
+        yield from get_events(days)
+
+    return stream
+
+
+escraper_streams = {
+    'timepad':      iter_timepad_events,
+    'radario':      _streamed(get_radario_events),
+    'ticketscloud': _streamed(get_ticketscloud_events),
+    'vk':           _streamed(get_vk_events),
+    'qtickets':     _streamed(get_qtickets_events),
+    'mts':          _streamed(get_mts_events),
+    'culture':      _streamed(get_culture_events)
+}
+
+
+# source -> stream(days, skip_days=0, changed_since=None), only timepad and
+# radario can skip days covered by previous sync (see `incremental_stream`)
+others_organizations_streams = {
+    'timepad':      timepad_others_window,
+    'radario':      radario_others_window,
+    'ticketscloud': _streamed(ticketscloud_others_organizations),
+    'vk':           _streamed(vk_others_organizations),
+    'qtickets':     _streamed(qtickets_others_organizations),
+    'mts':          _streamed(mts_others_organization),
+    'culture':      _streamed(culture_others_organizations)
 }
 
 
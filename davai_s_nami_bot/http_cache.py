@@ -0,0 +1,299 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .logger import get_logger
+
+
+HTTP_CACHE_DIR = os.environ.get("HTTP_CACHE_DIR", ".http_cache")
+HTTP_CACHE_MAX_SIZE = 200 * 1024 * 1024
+HTTP_CACHE_MAX_AGE = 60 * 60 * 24 * 2
+EVICT_INTERVAL = 60
+
+# headers which describe stored (already decoded) body, not the original one
+_SKIPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+log = get_logger(__file__)
+
+
+class DiskCache:
+    """
+    Cache of HTTP responses on local disk shared between processes.
+
+    Every entry is a single file: JSON line with metadata followed by body.
+    Entries older than `max_age` seconds are removed, when total size is
+    bigger than `max_size` bytes least recently used entries are removed.
+    """
+
+    def __init__(
+        self,
+        directory: str = HTTP_CACHE_DIR,
+        max_size: int = HTTP_CACHE_MAX_SIZE,
+        max_age: int = HTTP_CACHE_MAX_AGE,
+    ):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self._evicted_at = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[Tuple[Dict, bytes]]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                meta = json.loads(file.readline())
+                body = file.read()
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        return meta, body
+
+    def set(self, key: str, meta: Dict, body: bytes):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        with open(tmp_path, "wb") as file:
+            file.write(json.dumps(meta).encode() + b"\n")
+            file.write(body)
+        os.replace(tmp_path, path)
+
+        if time.time() - self._evicted_at > EVICT_INTERVAL:
+            self.evict()
+
+    def evict(self):
+        entries = []
+        now = time.time()
+        self._evicted_at = now
+
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+
+            if now - stat.st_mtime > self.max_age:
+                _remove(entry.path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            _remove(path)
+            total_size -= size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+
+class CachingAdapter(HTTPAdapter):
+    """
+    Transport adapter with conditional requests.
+
+    GET responses with `ETag`, `Last-Modified` or `Cache-Control: max-age`
+    are stored in `DiskCache`. Fresh entries are returned without request,
+    stale ones are revalidated with `If-None-Match`/`If-Modified-Since` and
+    returned from cache on `304 Not Modified`. Statistics are collected per
+    `source` (see `stats`).
+    """
+
+    def __init__(self, source: str, cache: DiskCache = None, **kwargs):
+        super().__init__(**kwargs)
+        self.source = source
+        self.cache = cache
+
+    def send(self, request: requests.PreparedRequest, **kwargs):
+        if request.method != "GET" or _no_store(request.headers):
+            return super().send(request, **kwargs)
+
+        cache = self.cache or get_disk_cache()
+        key = hashlib.sha1(request.url.encode()).hexdigest()
+        entry = cache.get(key)
+
+        if entry is not None:
+            meta, body = entry
+            if _is_fresh(meta):
+                _count(self.source, "hits")
+                return _cached_response(request, meta, body)
+
+            headers = CaseInsensitiveDict(meta["headers"])
+            if headers.get("ETag"):
+                request.headers["If-None-Match"] = headers["ETag"]
+            if headers.get("Last-Modified"):
+                request.headers["If-Modified-Since"] = headers["Last-Modified"]
+
+        response = super().send(request, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            _count(self.source, "revalidated")
+            headers.update(_stored_headers(response.headers))
+            meta["headers"] = dict(headers)
+            meta["stored_at"] = time.time()
+            cache.set(key, meta, body)
+            response.close()
+            return _cached_response(request, meta, body)
+
+        _count(self.source, "misses")
+        if response.status_code == 200 and _is_cacheable(response.headers):
+            meta = dict(
+                status=response.status_code,
+                headers=_stored_headers(response.headers),
+                stored_at=time.time(),
+            )
+            cache.set(key, meta, response.content)
+
+        return response
+
+
+def install(session: requests.Session, source: str, **adapter_kwargs):
+    """
+    Mount `CachingAdapter` to `session`.
+    """
+    adapter = CachingAdapter(source, **adapter_kwargs)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def install_to_parser(parser, source: str) -> bool:
+    """
+    Mount `CachingAdapter` to session of escraper parser, if parser keeps one
+    (as `session`, `_session` or any other attribute). Requests of parser
+    without session aren't cached, it's logged as warning.
+    """
+    candidates = [getattr(parser, name, None) for name in ("session", "_session")]
+    candidates += list(getattr(parser, "__dict__", {}).values())
+
+    for session in candidates:
+        if isinstance(session, requests.Session):
+            install(session, source)
+            return True
+
+    log.warning(
+        f"HTTP cache isn't installed for {source}: "
+        f"parser {type(parser).__name__} has no requests.Session"
+    )
+    return False
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    """
+    Hits, revalidated (304) and misses counts of current process by source.
+    """
+    with _stats_lock:
+        return {source: dict(counter) for source, counter in _stats.items()}
+
+
+def log_stats():
+    for source, counter in stats().items():
+        log.info(
+            f"HTTP cache {source}: {counter.get('hits', 0)} hits, "
+            f"{counter.get('revalidated', 0)} revalidated, "
+            f"{counter.get('misses', 0)} misses"
+        )
+
+
+_disk_cache = None
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def get_disk_cache() -> DiskCache:
+    global _disk_cache
+
+    if _disk_cache is None:
+        _disk_cache = DiskCache()
+
+    return _disk_cache
+
+
+def _count(source: str, name: str):
+    with _stats_lock:
+        _stats.setdefault(source, Counter())[name] += 1
+
+
+def _cache_control(headers) -> Dict[str, Optional[str]]:
+    directives = {}
+    for directive in headers.get("Cache-Control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+
+    return directives
+
+
+def _no_store(headers) -> bool:
+    return "no-store" in _cache_control(headers)
+
+
+def _is_cacheable(headers) -> bool:
+    cache_control = _cache_control(headers)
+    if "no-store" in cache_control or "private" in cache_control:
+        return False
+
+    return bool(
+        headers.get("ETag") or headers.get("Last-Modified") or "max-age" in cache_control
+    )
+
+
+def _is_fresh(meta: Dict) -> bool:
+    headers = CaseInsensitiveDict(meta["headers"])
+    cache_control = _cache_control(headers)
+
+    if "no-cache" in cache_control:
+        return False
+
+    age = time.time() - meta["stored_at"]
+    max_age = cache_control.get("max-age")
+    if max_age is not None:
+        try:
+            return age < int(max_age)
+        except ValueError:
+            return False
+
+    if headers.get("Expires"):
+        try:
+            return parsedate_to_datetime(headers["Expires"]).timestamp() > time.time()
+        except (TypeError, ValueError):
+            return False
+
+    return False
+
+
+def _stored_headers(headers) -> Dict[str, str]:
+    return {
+        name: value for name, value in headers.items()
+        if name.lower() not in _SKIPPED_HEADERS
+    }
+
+
+def _cached_response(request: requests.PreparedRequest, meta: Dict, body: bytes):
+    response = requests.Response()
+    response.status_code = meta["status"]
+    response.reason = "OK"
+    response.headers = CaseInsensitiveDict(meta["headers"])
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.url = request.url
+    response.request = request
+    response._content = body
+    response.from_cache = True
+    return response
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,118 @@
+import os
+import threading
+from typing import Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import http_cache
+
+
+# number of per-host connection pools kept by one session
+POOL_CONNECTIONS = 10
+# keep-alive connections per host (threads of celery worker / scraping engine)
+POOL_MAXSIZE = 20
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (5, 30)
+MAX_RETRIES = 3
+
+
+class TimeoutSession(requests.Session):
+    """
+    Session with default timeout for every request.
+    """
+
+    def __init__(self, timeout: Union[float, Tuple[float, Optional[float]]] = DEFAULT_TIMEOUT):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def get_session(
+    name: str = "default",
+    cache: bool = False,
+    timeout: Union[float, Tuple[float, Optional[float]]] = DEFAULT_TIMEOUT,
+    retry_reads: bool = True,
+) -> requests.Session:
+    """
+    Process-wide session with keep-alive connection pools, created on first use.
+
+    Parameters
+    ----------
+    name : str
+        Name of session, one session per external service (e.g. "vk", "dsn_site").
+
+    cache : bool
+        Mount `http_cache.CachingAdapter` (with `name` as source of statistics).
+
+    timeout : float or tuple
+        Default (connect, read) timeout of requests, read timeout may be None.
+
+    retry_reads : bool
+        Retry read timeouts and 502/503/504 responses. Must be False for
+        services which change data by GET requests, then only connection
+        errors (request wasn't sent) are retried.
+
+    Parameters of the first call with `name` are used.
+    """
+    with _lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = _sessions[name] = _create_session(name, cache, timeout, retry_reads)
+
+    return session
+
+
+def close_all():
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def _create_session(name, cache, timeout, retry_reads) -> requests.Session:
+    session = TimeoutSession(timeout)
+    if retry_reads:
+        retry = Retry(
+            total=MAX_RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False,
+        )
+    else:
+        retry = Retry(total=MAX_RETRIES, backoff_factor=0.5, read=0, status=0)
+
+    adapter_params = dict(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        max_retries=retry,
+    )
+
+    if cache:
+        adapter = http_cache.CachingAdapter(name, **adapter_params)
+    else:
+        adapter = HTTPAdapter(**adapter_params)
+
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _reset_after_fork():
+    global _lock
+
+    # connections of parent process must not be shared with forked workers
+    _sessions.clear()
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
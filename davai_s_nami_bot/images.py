@@ -0,0 +1,216 @@
+"""
+Posters of events for Telegram and VK.
+
+Poster is downloaded once, downscaled while decoding (`Image.draft` of JPEG)
+and encoded to a single JPEG within limits of both platforms: Telegram
+photo is up to 10 MB with width + height up to 10000, VK wall photo is up
+to 50 MB with width + height up to 14000.
+
+Posters of events scheduled for the next `PRERENDER_AHEAD` are rendered by
+`celery_tasks.prerender_posters`, so posting task only reads ready file.
+Poster is returned as bytes, one buffer is uploaded to all platforms.
+
+Rendered posters are content-addressed: file name is a hash of image url and
+rendering parameters, so reposts and retries reuse the file and changed
+parameters never return stale renders. Cache on disk is limited by
+`POSTERS_MAX_BYTES`, least recently used posters are evicted first (use
+updates mtime). With `POSTERS_REDIS_METADATA` url, size and render time of
+posters are mirrored to Redis hashes "poster:<key>".
+"""
+import hashlib
+import os
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO
+from typing import Iterable, Optional
+
+from PIL import Image
+from redis.exceptions import RedisError
+
+from davai_s_nami_bot.celery_app import redis_client
+from . import http_client
+from .logger import get_logger
+
+
+IMG_MAXSIZE = (1920, 1080)
+MAX_IMAGE_BYTES = 5_000_000
+JPEG_QUALITY = 90
+# quality is lowered by JPEG_QUALITY_STEP while image is larger than MAX_IMAGE_BYTES
+MIN_JPEG_QUALITY = 60
+JPEG_QUALITY_STEP = 10
+# part of cache key, bump when rendering changes
+RENDER_VERSION = 1
+POSTERS_DIR = os.environ.get("POSTERS_DIR", ".posters")
+POSTERS_MAX_BYTES = int(os.environ.get("POSTERS_MAX_BYTES", 500 * 1024 * 1024))
+POSTERS_REDIS_METADATA = os.environ.get("POSTERS_REDIS_METADATA", "") == "1"
+POSTER_METADATA_KEY = "poster:{key}"
+POSTER_METADATA_TTL = 60 * 60 * 24 * 30
+EVICT_INTERVAL = 60
+PRERENDER_AHEAD = timedelta(hours=3)
+
+log = get_logger(__file__)
+
+
+def prepare_image(image_url: str) -> Optional[bytes]:
+    """
+    JPEG of rendered poster of `image_url` (rendered now if wasn't prerendered).
+    """
+    if not image_url or isinstance(image_url, list):
+        return None
+
+    key = poster_key(image_url)
+    path = _poster_file(key)
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+        # mtime is time of last use for LRU eviction
+        os.utime(path)
+    except FileNotFoundError:
+        data = render_poster(download(image_url))
+        _write(path, data)
+        _save_metadata(key, image_url, len(data))
+        if time.time() - _evicted_at > EVICT_INTERVAL:
+            evict_posters()
+
+    return data
+
+
+def prerender_posters(image_urls: Iterable[str]) -> int:
+    """
+    Render posters which aren't rendered yet, returns number of rendered posters.
+    """
+    rendered = 0
+    for image_url in image_urls:
+        if not image_url or os.path.exists(_poster_file(poster_key(image_url))):
+            continue
+
+        try:
+            prepare_image(image_url)
+        except Exception as e:
+            log.warning(f"Failed to prerender poster {image_url}: {e}")
+        else:
+            rendered += 1
+
+    return rendered
+
+
+def evict_posters(max_bytes: int = POSTERS_MAX_BYTES) -> int:
+    """
+    Remove least recently used posters until cache fits `max_bytes`,
+    returns number of removed files.
+    """
+    global _evicted_at
+    _evicted_at = time.time()
+
+    posters = []
+    try:
+        for entry in os.scandir(POSTERS_DIR):
+            # skip files which are being written
+            if not entry.name.endswith(".jpg"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            posters.append((stat.st_mtime, stat.st_size, entry.path))
+    except FileNotFoundError:
+        return 0
+
+    total = sum(size for _, size, _ in posters)
+    removed = 0
+    for _, size, path in sorted(posters):
+        if total <= max_bytes:
+            break
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+
+    return removed
+
+
+def download(image_url: str) -> bytes:
+    response = http_client.get_session("images").get(image_url)
+    response.raise_for_status()
+    return response.content
+
+
+def render_poster(data: bytes, max_size=IMG_MAXSIZE) -> bytes:
+    """
+    JPEG of image `data` fitted into `max_size` and `MAX_IMAGE_BYTES`.
+    """
+    with Image.open(BytesIO(data)) as img:
+        if img.format == "JPEG":
+            # decoder scales down by 1/2, 1/4 or 1/8 (still not less than max_size),
+            # much faster than decoding full image
+            img.draft("RGB", max_size)
+
+        img.thumbnail(max_size, Image.LANCZOS)
+        img = _to_rgb(img)
+
+        quality = JPEG_QUALITY
+        while True:
+            buffer = BytesIO()
+            img.save(buffer, "jpeg", quality=quality, optimize=True, progressive=True)
+            if buffer.tell() <= MAX_IMAGE_BYTES or quality <= MIN_JPEG_QUALITY:
+                return buffer.getvalue()
+
+            quality -= JPEG_QUALITY_STEP
+
+
+def poster_key(image_url: str, max_size=IMG_MAXSIZE) -> str:
+    """
+    Cache key of poster of `image_url` rendered with current parameters.
+    """
+    params = f"{max_size[0]}x{max_size[1]}:{JPEG_QUALITY}:{MAX_IMAGE_BYTES}:{RENDER_VERSION}"
+    return hashlib.sha256(f"{image_url}\n{params}".encode()).hexdigest()
+
+
+def _poster_file(key: str) -> str:
+    return os.path.join(POSTERS_DIR, key + ".jpg")
+
+
+def _save_metadata(key: str, image_url: str, size: int):
+    if not POSTERS_REDIS_METADATA:
+        return
+
+    metadata_key = POSTER_METADATA_KEY.format(key=key)
+    try:
+        pipe = redis_client.pipeline()
+        pipe.hset(metadata_key, mapping={
+            "url": image_url, "size": size, "rendered_at": int(time.time()),
+        })
+        pipe.expire(metadata_key, POSTER_METADATA_TTL)
+        pipe.execute()
+    except RedisError as e:
+        log.warning(f"Failed to save metadata of poster {image_url}: {e}")
+
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    if img.mode == "RGB":
+        return img
+
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        # transparent background becomes white instead of black
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+
+    return img.convert("RGB")
+
+
+def _write(path: str, data: bytes):
+    # other worker may render the same poster, file is replaced atomically
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+
+_evicted_at = 0
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 
 class EventRequestParameters(BaseModel):
@@ -12,6 +12,10 @@ class EventRequestParameters(BaseModel):
     limit: Optional[int] = 20
     page: Optional[int] = None
     ids: Optional[List[int]] = None
+    # `next_cursor` of previous result, used instead of `page`
+    cursor: Optional[str] = None
+    # way of total_count calculation, by default exact for first page only
+    total: Optional[Literal['exact', 'approximate', 'none']] = None
 
     def with_defaults(self):
         return self
@@ -26,6 +30,8 @@ class EventRequestParameters(BaseModel):
             'limit': self.limit,
             'page': self.page,
             'ids':  self.ids,
+            'cursor': self.cursor,
+            'total': self.total,
         }
 
 
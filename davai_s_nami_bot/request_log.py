@@ -0,0 +1,213 @@
+"""
+Buffered logging of API requests to `api_request_log` table.
+
+Records are collected in memory and written by a background thread with
+multi-row inserts every `FLUSH_SIZE` records or `FLUSH_INTERVAL` seconds.
+When database is unavailable (or buffer is full) batches are spilled to
+JSON lines files in `SPILL_DIR` and written after the next successful
+flush; records are dropped only if spilling fails too.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List
+
+from . import crud
+from .logger import get_logger
+
+
+FLUSH_SIZE = 100
+FLUSH_INTERVAL = 5
+# records in memory, older ones are spilled to disk
+MAX_BUFFER_SIZE = 10000
+SPILL_DIR = os.environ.get("API_LOG_SPILL_DIR", ".api_request_log")
+
+log = get_logger(__file__)
+
+
+class RequestLogBuffer:
+    """
+    In-process buffer of API request records, see module docstring.
+    """
+
+    def __init__(
+        self,
+        flush_size: int = FLUSH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        max_buffer_size: int = MAX_BUFFER_SIZE,
+        spill_dir: str = SPILL_DIR,
+    ):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_buffer_size = max_buffer_size
+        self.spill_dir = spill_dir
+        self.dropped = 0
+
+        self._records = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add(self, record: Dict):
+        """
+        Add record without blocking on database.
+        """
+        if self._append(record):
+            self._spill(self._take(self.flush_size))
+
+    async def add_async(self, record: Dict):
+        """
+        Add record from event loop, spilling of full buffer runs in thread.
+        """
+        if self._append(record):
+            await asyncio.to_thread(self._spill, self._take(self.flush_size))
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="request_log", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """
+        Stop background thread and flush all buffered records.
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+        self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            while True:
+                records = self._take(self.flush_size)
+                if not records:
+                    break
+
+                if not self._write(records):
+                    self._spill(records)
+                    self._spill(self._take(len(self._records)))
+                    return
+
+            self._replay_spilled()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+
+            try:
+                self.flush()
+            except Exception:
+                log.exception("Failed to flush API request log")
+
+    def _append(self, record: Dict) -> bool:
+        """
+        Append record, returns True if buffer is full and oldest records should be spilled.
+        """
+        with self._lock:
+            self._records.append(record)
+            size = len(self._records)
+
+        if size >= self.max_buffer_size:
+            return True
+        if size >= self.flush_size:
+            self._wakeup.set()
+        return False
+
+    def _take(self, count: int) -> List[Dict]:
+        with self._lock:
+            return [self._records.popleft() for _ in range(min(count, len(self._records)))]
+
+    def _write(self, records: List[Dict]) -> bool:
+        try:
+            crud.save_api_request_logs(records)
+        except Exception as e:
+            log.error(f"Failed to save {len(records)} API request logs: {e}")
+            return False
+
+        return True
+
+    def _spill(self, records: List[Dict]):
+        if not records:
+            return
+
+        path = os.path.join(
+            self.spill_dir, f"{time.time():.6f}.{os.getpid()}.{threading.get_ident()}.jsonl"
+        )
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            with open(path, "w") as file:
+                for record in records:
+                    file.write(json.dumps(record, default=_serialize) + "\n")
+        except OSError as e:
+            self.dropped += len(records)
+            log.error(f"Dropped {len(records)} API request logs: {e}")
+
+    def _replay_spilled(self):
+        try:
+            paths = sorted(
+                entry.path for entry in os.scandir(self.spill_dir) if entry.name.endswith(".jsonl")
+            )
+        except FileNotFoundError:
+            return
+
+        for path in paths:
+            # other process may replay the same file, only one renames it
+            claimed_path = f"{path}.{os.getpid()}.claimed"
+            try:
+                os.rename(path, claimed_path)
+                with open(claimed_path) as file:
+                    records = [_deserialize(json.loads(line)) for line in file if line.strip()]
+                os.remove(claimed_path)
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError) as e:
+                log.error(f"Failed to read spilled API request logs {path}: {e}")
+                continue
+
+            for start in range(0, len(records), self.flush_size):
+                batch = records[start:start + self.flush_size]
+                if not self._write(batch):
+                    self._spill(records[start:])
+                    return
+
+
+def log_request(record: Dict):
+    """
+    Add API request record (columns of `ApiRequestLog`) to process-wide buffer.
+    """
+    request_log_buffer.add(record)
+
+
+async def log_request_async(record: Dict):
+    """
+    `log_request` for FastAPI handlers, doesn't block event loop on disk.
+    """
+    await request_log_buffer.add_async(record)
+
+
+def _serialize(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+def _deserialize(record: Dict) -> Dict:
+    if isinstance(record.get("timestamp"), str):
+        record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+    return record
+
+
+request_log_buffer = RequestLogBuffer()
@@ -0,0 +1,217 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, NamedTuple, Optional
+
+from .logger import get_logger
+
+
+SOURCE_TIMEOUT = 5 * 60
+FETCH_BUDGET = 15 * 60
+STREAM_QUEUE_SIZE = 1000
+
+log = get_logger(__file__)
+
+
+class SourceResult(NamedTuple):
+    source: str
+    elapsed: float
+    error: Optional[BaseException] = None
+    timed_out: bool = False
+    count: int = 0
+    # return value of source generator (e.g. `sync_state.Checkpoint`)
+    sync: Any = None
+
+    @property
+    def ok(self):
+        return self.error is None and not self.timed_out
+
+
+def log_source_result(result: SourceResult):
+    if result.timed_out:
+        log.warning(f"Source {result.source}: timed out after {result.elapsed:.1f}s")
+    elif result.error is not None:
+        log.error(
+            f"Source {result.source}: failed after {result.elapsed:.1f}s: {result.error!r}"
+        )
+    else:
+        log.info(
+            f"Source {result.source}: {result.count} events "
+            f"in {result.elapsed:.1f}s"
+        )
+
+
+class _Producer:
+    """
+    Fetch time of one source without time spent waiting for the consumer.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.waited = 0
+        self.blocked_since = None
+        self.cancelled = False
+
+    def elapsed(self) -> float:
+        now = time.monotonic()
+        blocked = now - self.blocked_since if self.blocked_since is not None else 0
+        return now - self.started - self.waited - blocked
+
+
+def stream_concurrently(
+    streams: Dict[str, Callable[[], Iterable[Any]]],
+    source_timeout: float = SOURCE_TIMEOUT,
+    budget: float = FETCH_BUDGET,
+    queue_size: int = STREAM_QUEUE_SIZE,
+    results: bool = False,
+) -> Iterator[Any]:
+    """
+    Consume every stream in its own thread and yield items as they arrive,
+    so the whole run takes as long as the slowest source.
+
+    Items are passed through a bounded queue, so producers wait while the
+    consumer is busy (e.g. inserting into database) and memory doesn't grow
+    with the number of events. Timing of every source is logged when it
+    finishes.
+
+    Parameters
+    ----------
+    streams : dict
+        Source name -> callable without arguments returning iterable of events.
+
+    source_timeout : float
+        Seconds of fetching given to a single source. Time spent waiting for
+        the consumer isn't counted. Items of a timed out source which weren't
+        yielded yet are dropped.
+
+    budget : float
+        Wall-clock seconds of the whole run, time spent by the consumer is
+        counted. When it's over, items aren't yielded anymore and sources
+        which haven't finished are timed out.
+
+    queue_size : int
+        Maximum number of items waiting for the consumer.
+
+    results : bool
+        Also yield `SourceResult` of every source after its last item, its
+        `sync` is the value returned by the source generator. Consumer can
+        commit per-source state once all items before it are processed.
+    """
+    deadline = time.monotonic() + budget
+    items = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    pending = {}
+
+    def put(producer, item):
+        producer.blocked_since = time.monotonic()
+        try:
+            while not (stop.is_set() or producer.cancelled):
+                try:
+                    items.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+        finally:
+            producer.waited += time.monotonic() - producer.blocked_since
+            producer.blocked_since = None
+
+        return False
+
+    def produce(source, stream, producer):
+        count, error, timed_out, sync = 0, None, False, None
+        try:
+            iterator = iter(stream())
+            while True:
+                try:
+                    item = next(iterator)
+                except StopIteration as e:
+                    sync = e.value
+                    break
+
+                if producer.elapsed() >= source_timeout:
+                    timed_out = True
+                    break
+                if not put(producer, (source, item)):
+                    return
+                count += 1
+        except Exception as e:
+            error = e
+
+        put(producer, (source, SourceResult(
+            source, producer.elapsed(), error, timed_out, count, sync
+        )))
+
+    for source, stream in streams.items():
+        producer = pending[source] = _Producer()
+        threading.Thread(
+            target=produce, args=(source, stream, producer),
+            name=f"escraper-{source}", daemon=True,
+        ).start()
+
+    try:
+        while pending:
+            remaining = min(source_timeout - producer.elapsed() for producer in pending.values())
+            remaining = min(remaining, deadline - time.monotonic())
+            try:
+                source, item = items.get(timeout=max(remaining, 0))
+            except queue.Empty:
+                pass
+            else:
+                if source not in pending:
+                    continue
+
+                if time.monotonic() >= deadline:
+                    # run is over budget, the source is timed out below
+                    pass
+                elif isinstance(item, SourceResult):
+                    del pending[source]
+                    log_source_result(item)
+                    if results:
+                        yield item
+                else:
+                    yield item
+
+            over_budget = time.monotonic() >= deadline
+            for source, producer in list(pending.items()):
+                if over_budget or producer.elapsed() >= source_timeout:
+                    del pending[source]
+                    producer.cancelled = True
+                    result = SourceResult(source, producer.elapsed(), timed_out=True)
+                    log_source_result(result)
+                    if results:
+                        yield result
+    finally:
+        stop.set()
+
+
+class RateLimiter:
+    """
+    Token bucket limiter shared between threads.
+
+    >>> limiter = RateLimiter(rate=2, capacity=2)
+    >>> limiter.acquire()  # blocks until a token is available
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+
+                wait_time = (tokens - self._tokens) / self.rate
+
+            time.sleep(wait_time)
@@ -0,0 +1,36 @@
+"""
+JSON serialization of API responses and cached payloads.
+
+orjson is used when installed (it encodes datetime natively and is several
+times faster), otherwise standard json with ISO format of datetime. Both
+return UTF-8 bytes, so encoded payloads can be stored in Redis and sent
+in HTTP responses as is.
+"""
+import json
+from datetime import date, datetime
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+
+    return json.loads(data)
+
+
+def _default(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Type {type(obj)} not serializable")
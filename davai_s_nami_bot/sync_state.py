@@ -0,0 +1,142 @@
+"""
+Per-source sync state for incremental scraping.
+
+For every source Redis keeps the last day covered by previous sync, time of
+previous (and last full) sync and content hashes of seen events. With it
+a nightly run requests only the new days at the window edge (plus events
+changed since previous sync, where the site allows it) and drops events
+which were already seen unchanged. Every `FULL_SYNC_INTERVAL` the whole
+window is re-scraped without skipping known events and hashes are
+rewritten, so hashes of past events don't pile up.
+
+State is saved by `mark_synced` only after all events of the source were
+inserted, otherwise events which weren't inserted would be skipped as known
+until the next full sync.
+"""
+import hashlib
+import json
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, NamedTuple, Optional
+
+from davai_s_nami_bot.celery_app import redis_client
+
+from .datetime_utils import get_msk_today
+
+
+FULL_SYNC_INTERVAL = timedelta(days=3)
+STATE_TTL = 60 * 60 * 24 * 30
+
+STATE_KEY = "sync_state:{source}"
+HASHES_KEY = "sync_state:{source}:hashes"
+
+
+class SyncWindow(NamedTuple):
+    source: str
+    days: int
+    skip_days: int
+    synced_at: Optional[datetime]
+    full: bool
+
+
+class Checkpoint(NamedTuple):
+    """
+    Sync of a source to save when its events are inserted.
+    """
+    window: SyncWindow
+    hashes: Dict[str, str]
+
+
+def plan_window(source: str, days: int, today: date = None) -> SyncWindow:
+    """
+    Window for next sync of `source`: first `skip_days` days of `days` were
+    already covered by previous sync.
+    """
+    today = today or get_msk_today().date()
+    state = _load_state(source)
+
+    if state is None or (
+        get_msk_today() - datetime.fromisoformat(state["full_synced_at"])
+        >= FULL_SYNC_INTERVAL
+    ):
+        return SyncWindow(source, days, 0, None, True)
+
+    covered_to = date.fromisoformat(state["covered_to"])
+    skip_days = min(max((covered_to - today).days, 0), days)
+
+    return SyncWindow(
+        source, days, skip_days, datetime.fromisoformat(state["synced_at"]), False
+    )
+
+
+def mark_synced(window: SyncWindow, hashes: Dict[str, str] = None, today: date = None):
+    """
+    Save sync state of `window` and content `hashes` of its new or changed
+    events (all known hashes are replaced by full sync).
+    """
+    today = today or get_msk_today().date()
+    now = get_msk_today().isoformat()
+    covered_to = today + timedelta(days=window.days)
+    full_synced_at = now
+
+    if not window.full:
+        state = _load_state(window.source) or {}
+        covered_to = max(
+            covered_to, date.fromisoformat(state.get("covered_to", covered_to.isoformat()))
+        )
+        full_synced_at = state.get("full_synced_at", now)
+
+    hashes_key = HASHES_KEY.format(source=window.source)
+    pipe = redis_client.pipeline()
+    if window.full:
+        pipe.delete(hashes_key)
+    if hashes:
+        pipe.hset(hashes_key, mapping=hashes)
+        pipe.expire(hashes_key, STATE_TTL)
+    pipe.setex(
+        STATE_KEY.format(source=window.source),
+        STATE_TTL,
+        json.dumps(dict(
+            covered_to=covered_to.isoformat(),
+            synced_at=now,
+            full_synced_at=full_synced_at,
+        )),
+    )
+    pipe.execute()
+
+
+def only_changed(
+    source: str, events: Iterable[Any], hashes: Dict[str, str], skip_known: bool = True
+) -> Iterator[Any]:
+    """
+    Yield events which are new or changed since previous sync of `source`.
+    Hashes of yielded events are added to `hashes` (see `mark_synced`).
+    """
+    key = HASHES_KEY.format(source=source)
+    known = {}
+    if skip_known:
+        known = {
+            event_id.decode(): event_hash.decode()
+            for event_id, event_hash in redis_client.hgetall(key).items()
+        }
+
+    for event in events:
+        event_hash = content_hash(event)
+        if known.get(event.event_id) != event_hash:
+            hashes[event.event_id] = event_hash
+            yield event
+
+
+def content_hash(event: Any) -> str:
+    data = [
+        event.title, event.from_date, event.to_date, event.price,
+        event.url, event.image, event.address,
+    ]
+    return hashlib.md5(json.dumps(data, default=str).encode()).hexdigest()
+
+
+def _load_state(source: str):
+    state = redis_client.get(STATE_KEY.format(source=source))
+    if state is None:
+        return None
+
+    return json.loads(state)
@@ -1,10 +1,7 @@
 import os
 import warnings
-from io import BytesIO
 
-import PIL
-import requests
-from PIL import Image
+from . import images
 
 
 CONSTANTS_FILE_NAME = "prod_constants"
@@ -31,7 +28,6 @@ MONTHNAMES = {
     11: "ноября",
     12: "декабря",
 }
-IMG_MAXSIZE = (1920, 1080)
 REQUIRED_CONSTANT_NAMES = [
     "TIMEPAD_TOKEN",
     "BOT_TOKEN",
@@ -94,32 +90,7 @@ def read_constants():
 
 
 def prepare_image(image_url):
-    if image_url is None or isinstance(image_url, list) or image_url=='':
-        image_path = None
-
-    else:
-        with Image.open(BytesIO(requests.get(image_url).content)) as img:
-            image_name = "img"
-            img.thumbnail(IMG_MAXSIZE, PIL.Image.ANTIALIAS)
-
-            if img.mode != "RGB":
-                img = img.convert("RGB")
-
-            # TODO: if line above work fine, this isn't necessary
-            if img.mode == "CMYK":
-                # can't save CMYK as PNG
-                img.save(image_name + ".jpg", "jpeg")
-                image_path = image_name + ".jpg"
-
-            else:
-                img.save(image_name + ".png", "png")
-                img.save(image_name + ".jpg", "jpeg")
-
-                image_size = os.path.getsize(image_name + ".png") / 1_000_000
-
-                if image_size > 5:
-                    image_path = image_name + ".jpg"
-                else:
-                    image_path = image_name + ".png"
-
-    return image_path
+    """
+    Poster (JPEG bytes) for posting, see `images.prepare_image`.
+    """
+    return images.prepare_image(image_url)
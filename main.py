@@ -1,19 +1,34 @@
+import asyncio
 import os, json
-import hashlib
+from contextlib import asynccontextmanager
 from datetime import datetime
 
 from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 
-from davai_s_nami_bot.celery_app import celery_app, redis_client
+from davai_s_nami_bot.celery_app import celery_app, async_redis_client
 from celery.result import AsyncResult
 
-from davai_s_nami_bot import crud
+from davai_s_nami_bot import api_cache, crud, request_log, serializer
 
 from davai_s_nami_bot.pydantic_models import EventRequestParameters, PlaceRequestParameters
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    request_log.request_log_buffer.start()
+    yield
+    # buffered records are written to database before exit
+    await run_in_threadpool(request_log.request_log_buffer.stop)
+
+
+app = FastAPI(
+    default_response_class=ORJSONResponse if serializer.orjson else JSONResponse,
+    lifespan=lifespan,
+)
 
 origins = [
     "http://example.com",
@@ -42,16 +57,20 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
         raise HTTPException(status_code=403, detail="Invalid token")
 
 
-def get_cache_key(params: dict):
-    key = json.dumps(params, sort_keys=True)
-    return hashlib.md5(key.encode()).hexdigest()
+def _dumps(query, params) -> bytes:
+    return serializer.dumps(query(params))
+
 
+def _cached_response(result: bytes, cached: bool) -> Response:
+    """
+    Response with already encoded `result`, it isn't decoded and encoded again.
+    """
+    if cached:
+        envelope = b'{"status":"success","message":"cached","result":'
+    else:
+        envelope = b'{"status":"success","result":'
 
-def serialize_datetime(obj):
-    """Функция для сериализации datetime в строку"""
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    raise TypeError(f"Type {type(obj)} not serializable")
+    return Response(content=envelope + result + b'}', media_type='application/json')
 
 
 async def log_api_request(request: Request, data=None):
@@ -61,23 +80,21 @@ async def log_api_request(request: Request, data=None):
         request: FastAPI request object
         data: Request data (can be None for empty requests)
     """
-    celery_app.send_task(
-        'davai_s_nami_bot.celery_tasks.log_api_request',
-        args=[{
-            'ip': request.client.host,
-            'endpoint': str(request.url),
-            'method': request.method,
-            'status_code': 200,
-            'timestamp': datetime.now().isoformat(),
-            'user_agent': request.headers.get('User-Agent'),
-            'request_data': json.dumps(data) if data is not None else None,
-        }]
-    )
+    await request_log.log_request_async({
+        'ip': request.client.host,
+        'endpoint': str(request.url),
+        'method': request.method,
+        'status_code': 200,
+        'timestamp': datetime.now(),
+        'user_agent': request.headers.get('User-Agent'),
+        'request_data': json.dumps(data) if data is not None else None,
+    })
 
 
 @app.post('/api/schedule-update-events/')
 async def update_events(request: Request, token: str = Depends(verify_token)):
-    task = celery_app.send_task(
+    task = await run_in_threadpool(
+        celery_app.send_task,
         'davai_s_nami_bot.celery_tasks.update_events',
     )
     return {'message': 'Task Update events added to queue', 'task_id': task.id}
@@ -85,7 +102,8 @@ async def update_events(request: Request, token: str = Depends(verify_token)):
 
 @app.post('/api/schedule-full-update/')
 async def update_events(request: Request, token: str = Depends(verify_token)):
-    task = celery_app.send_task(
+    task = await run_in_threadpool(
+        celery_app.send_task,
         'davai_s_nami_bot.celery_tasks.full_update',
     )
     return {'message': 'Task Full Update added to queue', 'task_id': task.id}
@@ -101,7 +119,8 @@ async def event_from_url(request: Request, token: str = Depends(verify_token)):
 
     await log_api_request(request, data)
 
-    task = celery_app.send_task(
+    task = await run_in_threadpool(
+        celery_app.send_task,
         'davai_s_nami_bot.celery_tasks.events_from_url',
         args=[event_url],
     )
@@ -110,16 +129,54 @@ async def event_from_url(request: Request, token: str = Depends(verify_token)):
 
 @app.get("/api/status/{task_id}")
 async def get_status(task_id: str, token: str = Depends(verify_token)):
-    params = redis_client.get(task_id)
+    params = await async_redis_client.get(task_id)
     result = AsyncResult(task_id, app=celery_app)
-    if result.state == 'SUCCESS':
+    # result backend is requested synchronously
+    state = await run_in_threadpool(lambda: result.state)
+    if state == 'SUCCESS':
         if params:
-            redis_client.setex(params, 60 * 60, json.dumps(result.result, default=serialize_datetime))
+            await async_redis_client.setex(params, 60 * 60, serializer.dumps(result.result))
         return {"status": "success", "result": result.result}
-    elif result.state == 'FAILURE':
+    elif state == 'FAILURE':
         return {"status": "failure", "error": str(result.info)}
     else:
-        return {"status": result.state}
+        return {"status": state}
+
+@app.get("/api/cache_stats/")
+async def get_cache_stats(token: str = Depends(verify_token)):
+    return await api_cache.stats()
+
+
+def _invalidate_cache(data: dict):
+    events, places = data.get('events'), data.get('places')
+    if events == 'all':
+        api_cache.invalidate_events()
+    elif events:
+        api_cache.invalidate_events(crud.get_events_dates([int(event_id) for event_id in events]))
+
+    if places == 'all':
+        api_cache.invalidate_places()
+    elif places:
+        api_cache.invalidate_places([int(place_id) for place_id in places])
+
+
+@app.post("/api/invalidate_cache/")
+async def invalidate_cache(request: Request, token: str = Depends(verify_token)):
+    """
+    Called by DSN site on save: {"events": [ids] or "all", "places": [ids] or "all"}.
+    Events by ids are invalidated for their current dates, send "all" if dates were changed.
+    """
+    data = await request.json()
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Body must be a JSON object")
+
+    try:
+        await run_in_threadpool(_invalidate_cache, data)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {'message': 'API cache invalidated'}
+
 
 @app.get("/")
 async def index():
@@ -128,7 +185,8 @@ async def index():
 
 @app.post('/api/param/')
 async def update_parameters(token: str = Depends(verify_token)):
-    task = celery_app.send_task(
+    task = await run_in_threadpool(
+        celery_app.send_task,
         'davai_s_nami_bot.celery_tasks.update_parameters',
     )
     return {'message': 'Task PARAMETERS added to queue', 'task_id': task.id}
@@ -138,7 +196,8 @@ async def update_parameters(token: str = Depends(verify_token)):
 async def new_event_from_data(request: Request, token: str = Depends(verify_token), ):
     data = await request.json()
 
-    task = celery_app.send_task(
+    task = await run_in_threadpool(
+        celery_app.send_task,
         'davai_s_nami_bot.celery_tasks.ai_update_event',
         args=[data['event'], data['is_new']],
     )
@@ -154,7 +213,8 @@ async def moderate_events(request: Request, token: str = Depends(verify_token),
         if 'examples' in data.keys:
             args.push(data['examples'])
 
-        task = celery_app.send_task(
+        task = await run_in_threadpool(
+            celery_app.send_task,
             'davai_s_nami_bot.celery_tasks.ai_moderate_events',
             args=args,
         )
@@ -167,7 +227,8 @@ async def moderate_events(request: Request, token: str = Depends(verify_token),
 async def moderate_not_approved_events(request: Request, token: str = Depends(verify_token), ):
     data = await request.json()
 
-    task = celery_app.send_task(
+    task = await run_in_threadpool(
+        celery_app.send_task,
         'davai_s_nami_bot.celery_tasks.ai_moderate_not_approved_events',
         args=[data],
     )
@@ -178,7 +239,8 @@ async def moderate_not_approved_events(request: Request, token: str = Depends(ve
 async def prepare_events(request: Request, token: str = Depends(verify_token), ):
     data = await request.json()
 
-    task = celery_app.send_task(
+    task = await run_in_threadpool(
+        celery_app.send_task,
         'davai_s_nami_bot.celery_tasks.prepare_events',
         args=[data],
     )
@@ -189,7 +251,8 @@ async def prepare_events(request: Request, token: str = Depends(verify_token), )
 async def new_event_from_sites(request: Request, token: str = Depends(verify_token)):
     data = await request.json()
 
-    task = celery_app.send_task(
+    task = await run_in_threadpool(
+        celery_app.send_task,
         'davai_s_nami_bot.celery_tasks.update_event_from_sites',
         args=[data['sites'], data['days']],
     )
@@ -200,19 +263,21 @@ async def new_event_from_sites(request: Request, token: str = Depends(verify_tok
 async def get_valid_events(request: Request, token: str = Depends(verify_token)):
 
     data = await request.json()
-    cache_key = get_cache_key(data)
-    cached_data = redis_client.get(cache_key)
-
     await log_api_request(request, data)
 
-    if cached_data:
-        return {"status": "success", "message": 'cached', "result": json.loads(cached_data)}
-
     params = EventRequestParameters(**data).with_defaults()
+    cache_key = await api_cache.cache_key('events', data, api_cache.events_tags(params))
 
-    result = crud.get_events_by_date_and_category(params)
-    redis_client.setex(cache_key, 60 * 10, json.dumps(result, default=serialize_datetime))
-    return {"status": "success", "result": result}
+    try:
+        result, cached = await api_cache.get_or_compute(
+            cache_key,
+            lambda: run_in_threadpool(_dumps, crud.get_events_by_date_and_category, params),
+            api_cache.EVENTS_TTL,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return _cached_response(result, cached)
 
 
 @app.post("/api/get_valid_event/{event_id}")
@@ -223,17 +288,18 @@ async def get_valid_event_by_id(
     ):
     await log_api_request(request, {"ids": [event_id]})
 
-    cached_data = redis_client.get(f"event_{event_id}")
-    if cached_data:
-        return {"status": "success", "message": 'cached', "result": json.loads(cached_data)}
-
     data = {"ids": [event_id]}
 
     params = EventRequestParameters(**data).with_defaults()
-    result = crud.get_events_by_date_and_category(params)
-    redis_client.setex(f"event_{event_id}", 60 * 10, json.dumps(result, default=serialize_datetime))
+    cache_key = await api_cache.cache_key('event', data, api_cache.events_tags(params))
+
+    result, cached = await api_cache.get_or_compute(
+        cache_key,
+        lambda: run_in_threadpool(_dumps, crud.get_events_by_date_and_category, params),
+        api_cache.EVENTS_TTL,
+    )
 
-    return {"status": "success", "result": result}
+    return _cached_response(result, cached)
 
 
 @app.post('/api/get_places/')
@@ -243,22 +309,24 @@ async def get_places(
     ):
     data = await request.json()
     await log_api_request(request, data)
-    cache_key = get_cache_key(data)
-    cached_data = redis_client.get(cache_key)
-    if cached_data:
-        return {"status": "success", "message": 'cached', "result": json.loads(cached_data)}
 
     params = PlaceRequestParameters(**data)
-    places = crud.get_places(params)
-    redis_client.setex(cache_key, 60 * 10, json.dumps(places, default=serialize_datetime))
-    result = {
-        "status": "success",
-        "result": {
-            'request': data,
-            'places': places
-        }
-    }
-    return result
+    cache_key = await api_cache.cache_key('places', data, api_cache.places_tags(params))
+
+    try:
+        places, cached = await api_cache.get_or_compute(
+            cache_key,
+            lambda: run_in_threadpool(_dumps, crud.get_places, params),
+            api_cache.PLACES_TTL,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if cached:
+        return _cached_response(places, cached)
+
+    return _cached_response(
+        b'{"request":' + serializer.dumps(data) + b',"places":' + places + b'}', cached
+    )
 
 
 @app.post("/api/get_place/{place_id}")
@@ -269,28 +337,29 @@ async def get_place_by_id(
     ):
 
     await log_api_request(request, {'place_id': place_id})
-    cached_data = redis_client.get(f"place_{place_id}")
-    if cached_data:
-        return {"status": "success", "message": 'cached', "result": json.loads(cached_data)}
 
     data = {"ids": [place_id]}
 
     params = PlaceRequestParameters(**data)
-    places = crud.get_places(params)
-    redis_client.setex(f"place_{place_id}", 60 * 10, json.dumps(places, default=serialize_datetime))
-    result = {
-        "status": "success",
-        "result": {
-            'request': data,
-            'places': places
-        }
-    }
-    return result
+    cache_key = await api_cache.cache_key('place', data, api_cache.places_tags(params))
+
+    places, cached = await api_cache.get_or_compute(
+        cache_key,
+        lambda: run_in_threadpool(_dumps, crud.get_places, params),
+        api_cache.PLACES_TTL,
+    )
+    if cached:
+        return _cached_response(places, cached)
+
+    return _cached_response(
+        b'{"request":' + serializer.dumps(data) + b',"places":' + places + b'}', cached
+    )
 
 
 @app.post('/api/get_exhibitions/')
 async def get_exhibitions(request: Request, token: str = Depends(verify_token)):
-    task = celery_app.send_task(
+    task = await run_in_threadpool(
+        celery_app.send_task,
         'davai_s_nami_bot.celery_tasks.get_exhibitions_celery',
     )
     await log_api_request(request)
@@ -302,12 +371,14 @@ async def search(query: str, limit: int = 10, type: str = 'event',
         request: Request = None, token: str = Depends(verify_token)):
     events, places = [], []
     if type == 'event':
-        events = crud.search_events_by_string(query, limit)
+        events = await run_in_threadpool(crud.search_events_by_string, query, limit)
     elif type == 'place':
-        places = crud.search_places_by_name(query, limit)
+        places = await run_in_threadpool(crud.search_places_by_name, query, limit)
     else:
-        events = crud.search_events_by_string(query, limit)
-        places = crud.search_places_by_name(query, limit)
+        events, places = await asyncio.gather(
+            run_in_threadpool(crud.search_events_by_string, query, limit),
+            run_in_threadpool(crud.search_places_by_name, query, limit),
+        )
     await log_api_request(request, {'query': query, 'limit': limit, 'type': type})
     return {"events": events, "places": places}
 
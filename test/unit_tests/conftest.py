@@ -10,7 +10,9 @@ sys.path.insert(0, project_root)
 
 from test.test_config import TEST_ENV, TEST_SITE_PARAMS
 
-fake_redis = fakeredis.FakeRedis()
+# shared with async clients of tests (see `mock_redis_server`)
+fake_redis_server = fakeredis.FakeServer()
+fake_redis = fakeredis.FakeRedis(server=fake_redis_server)
 
 fake_redis.setex(
     'parameters:dsn_site',
@@ -32,4 +34,10 @@ for p in patches:
 @pytest.fixture(scope="session")
 def mock_redis():
     """Fixture for fake redis"""
-    return fake_redis 
\ No newline at end of file
+    return fake_redis 
+
+
+@pytest.fixture(scope="session")
+def mock_redis_server():
+    """Server of fake redis for `fakeredis.aioredis.FakeRedis(server=...)`"""
+    return fake_redis_server
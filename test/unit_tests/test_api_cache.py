@@ -0,0 +1,154 @@
+import asyncio
+import datetime
+
+import fakeredis
+import pytest
+
+from davai_s_nami_bot import api_cache, serializer
+from davai_s_nami_bot.pydantic_models import EventRequestParameters, PlaceRequestParameters
+
+
+@pytest.fixture(autouse=True)
+def clean_cache(mock_redis):
+    for key in mock_redis.keys('api_cache:*'):
+        mock_redis.delete(key)
+
+
+@pytest.fixture
+def run(mock_redis_server, monkeypatch):
+    def run(coroutine_function, *args):
+        async def main():
+            # async client is bound to event loop of its first call
+            monkeypatch.setattr(api_cache, 'async_redis_client', fakeredis.aioredis.FakeRedis(server=mock_redis_server))
+            return await coroutine_function(*args)
+
+        return asyncio.run(main())
+
+    return run
+
+
+def _events_key(run, params):
+    return run(api_cache.cache_key, 'events', {}, api_cache.events_tags(params))
+
+
+def test_event_change_invalidates_only_its_months(run):
+    july = EventRequestParameters(
+        date_from=datetime.datetime(2030, 7, 1), date_to=datetime.datetime(2030, 7, 31),
+    )
+    september = EventRequestParameters(
+        date_from=datetime.datetime(2030, 9, 1), date_to=datetime.datetime(2030, 9, 30),
+    )
+    july_key, september_key = _events_key(run, july), _events_key(run, september)
+
+    api_cache.invalidate_events([(1, datetime.datetime(2030, 7, 10), datetime.datetime(2030, 8, 2))])
+
+    assert _events_key(run, july) != july_key
+    assert _events_key(run, september) == september_key
+
+
+def test_event_change_invalidates_open_range_and_event(run):
+    all_params = [
+        EventRequestParameters(date_from=datetime.datetime(2030, 1, 1)),
+        EventRequestParameters(ids=[1]),
+        EventRequestParameters(ids=[2]),
+    ]
+    open_key, event_key, other_event_key = [_events_key(run, params) for params in all_params]
+
+    api_cache.invalidate_events([(1, datetime.datetime(2030, 7, 10), None)])
+
+    assert _events_key(run, all_params[0]) != open_key
+    assert _events_key(run, all_params[1]) != event_key
+    assert _events_key(run, all_params[2]) == other_event_key
+
+
+def test_invalidate_all_events_and_places(run):
+    by_id = EventRequestParameters(ids=[2])
+    places_tags = api_cache.places_tags(PlaceRequestParameters())
+    key = _events_key(run, by_id)
+    places_key = run(api_cache.cache_key, 'places', {}, places_tags)
+
+    api_cache.invalidate_events()
+
+    assert _events_key(run, by_id) != key
+    assert run(api_cache.cache_key, 'places', {}, places_tags) == places_key
+
+    api_cache.invalidate_places([7])
+
+    assert run(api_cache.cache_key, 'places', {}, places_tags) != places_key
+
+
+def test_get_or_compute_single_flight(run):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.2)
+        return b'{"events": []}'
+
+    async def requests():
+        return await asyncio.gather(*[
+            api_cache.get_or_compute('api_cache:test:single', compute, 60) for _ in range(5)
+        ])
+
+    results = run(requests)
+
+    assert len(calls) == 1
+    assert {value for value, _ in results} == {b'{"events": []}'}
+    assert sorted(cached for _, cached in results) == [False, True, True, True, True]
+
+
+def test_stale_entry_is_served_and_refreshed(run, mock_redis):
+    async def value(text):
+        return text
+
+    async def requests():
+        await api_cache.get_or_compute('api_cache:test:stale', lambda: value(b'old'), 60)
+        await api_cache.async_redis_client.hset('api_cache:test:stale', 'fresh_until', 0)
+
+        stale = await api_cache.get_or_compute('api_cache:test:stale', lambda: value(b'new'), 60)
+        await asyncio.gather(*api_cache._refresh_tasks)
+        fresh = await api_cache.get_or_compute('api_cache:test:stale', lambda: value(b'newest'), 60)
+        return stale, fresh
+
+    stale, fresh = run(requests)
+
+    assert stale == (b'old', True)
+    assert fresh == (b'new', True)
+    ttl = mock_redis.ttl('api_cache:test:stale')
+    assert 60 * (1 - api_cache.TTL_JITTER) - 1 <= ttl <= 60 * (1 + api_cache.TTL_JITTER)
+
+
+def test_large_entry_is_stored_compressed(run, mock_redis, monkeypatch):
+    monkeypatch.setattr(api_cache, '_stats', api_cache.Counter())
+    payload = serializer.dumps([{'id': i, 'title': 'Концерт'} for i in range(1000)])
+    assert len(payload) >= api_cache.COMPRESS_MIN_SIZE
+
+    async def value(text):
+        return text
+
+    async def requests():
+        computed = await api_cache.get_or_compute('api_cache:test:large', lambda: value(payload), 60)
+        cached = await api_cache.get_or_compute('api_cache:test:large', lambda: value(b'new'), 60)
+        small = await api_cache.get_or_compute('api_cache:test:small', lambda: value(b'[]'), 60)
+        return computed, cached, small, await api_cache.stats()
+
+    computed, cached, small, stats = run(requests)
+
+    assert computed == (payload, False)
+    assert cached == (payload, True)
+    assert small == (b'[]', False)
+    assert mock_redis.hget('api_cache:test:large', 'codec') == api_cache.CODEC.encode()
+    assert len(mock_redis.hget('api_cache:test:large', 'data')) < len(payload) / 4
+    assert mock_redis.hget('api_cache:test:small', 'data') == b'[]'
+    assert stats['hits'] == 1 and stats['misses'] == 2
+    assert stats['compressed'] >= 1
+    assert stats['compression_ratio'] > 1
+
+
+def test_serializer_round_trip():
+    payload = {'events': [{'title': 'Концерт', 'from_date': datetime.datetime(2030, 1, 1, 19, 30)}]}
+
+    encoded = serializer.dumps(payload)
+
+    assert isinstance(encoded, bytes)
+    assert serializer.loads(encoded) == {'events': [{'title': 'Концерт', 'from_date': '2030-01-01T19:30:00'}]}
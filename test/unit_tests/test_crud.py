@@ -6,15 +6,16 @@ import os
 from unittest.mock import MagicMock
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event as sa_event
 from sqlalchemy.orm import sessionmaker
 
 import davai_s_nami_bot.database.database_orm as db_orm
 import davai_s_nami_bot.crud as crud_module
 from davai_s_nami_bot.crud import get_ready_to_post_events, get_scrape_it_events, add_events_to_post
 from davai_s_nami_bot import crud
-from davai_s_nami_bot.database.models import Events2Posts, Base
+from davai_s_nami_bot.database.models import ApiRequestLog, Events2Posts, Base
 from davai_s_nami_bot.events import Event
+from davai_s_nami_bot.pydantic_models import EventRequestParameters
 
 DSN_DATABASE_URL = os.getenv('DSN_DATABASE_URL')
 
@@ -104,7 +105,7 @@ def test_get_ready_to_post_events(test_db, monkeypatch):
         from_date=datetime.datetime.today(),
         to_date=datetime.datetime.today(),
         image='image',
-        event_id='EVENT_333',
+        event_id='EVENT_444',
         price='300₽',
         category='Лекция',
         address='address'
@@ -134,7 +135,7 @@ def test_get_scrape_it_events(test_db, monkeypatch):
             url='http://timepad.ru/111', post_url='-',
             from_date=datetime.datetime(2030,9,14),
             to_date=datetime.datetime(2030,9,17),
-            image='image3.jpg', event_id='EVENT_333',
+            image='image3.jpg', event_id='EVENT_555',
             price='Free',category='Концерт', address='address 3'
         )
     test_db.add(scrape_it_event)
@@ -182,6 +183,32 @@ def test_add_event_to_post(test_db, monkeypatch):
     assert result[0].queue == last_queue + queue_increase
 
 
+def test_add_events_to_post_in_bulk(test_db, monkeypatch):
+    @contextmanager
+    def get_test_db():
+        yield test_db
+
+    monkeypatch.setattr(db_orm, 'get_db_session', get_test_db)
+
+    last_queue = crud.get_last_queue_value()
+    events = [
+        Event.from_dict({
+            'id': None, 'title': f'Bulk event {number}', 'url': f'bulk_url_{number}',
+            'from_date': datetime.datetime(2030, 8, 3), 'to_date': None,
+            'image': 'image.jpg', 'event_id': f'BULK_EVENT_{number}',
+            'price': 'Free', 'category': 'Концерт', 'address': 'address',
+        })
+        for number in range(5)
+    ]
+
+    inserted_ids = add_events_to_post(events, datetime.datetime.today(), 2)
+
+    assert len(inserted_ids) == 5
+    rows = {row.id: row for row in test_db.query(Events2Posts).filter(Events2Posts.id.in_(inserted_ids))}
+    assert [rows[event_id].title for event_id in inserted_ids] == [event.title for event in events]
+    assert [rows[event_id].queue for event_id in inserted_ids] == [last_queue + 2 * n for n in range(1, 6)]
+
+
 def test_count_events(test_db, monkeypatch):
     @contextmanager
     def get_test_db():
@@ -192,5 +219,132 @@ def test_count_events(test_db, monkeypatch):
 
     assert events_count == 3
 
+    statistics = crud.get_events_statistics()
+
+    assert statistics['total'] == events_count
+    assert statistics['tables']['events_events2post'] == 3
+    assert statistics['statuses'] == {'ReadyToPost': 2, 'Spam': 1}
+    assert crud.count_events_by_status('ReadyToPost') == 2
+
+
+
+
+
+def test_get_existing_event_ids(test_db, monkeypatch):
+    @contextmanager
+    def get_test_db():
+        yield test_db
+
+    monkeypatch.setattr(db_orm, 'get_db_session', get_test_db)
+    monkeypatch.setattr(crud_module, 'EVENT_IDS_CHUNK_SIZE', 2)
+
+    existing = crud.get_existing_event_ids(['EVENT_111', 'NEW_1', 'EVENT_333', 'NEW_2', 'EVENT_111'])
+
+    assert existing == {'EVENT_111', 'EVENT_333'}
+
+
+def test_get_events_by_date_and_category_with_cursor(test_db, monkeypatch):
+    @contextmanager
+    def get_test_db():
+        yield test_db
+
+    monkeypatch.setattr(db_orm, 'get_db_session', get_test_db)
+
+    for number in range(5):
+        test_db.add(Events2Posts(
+            id=100 + number, title=f'Posted event {number}', status='Posted',
+            url='url', event_id=f'POSTED_{number}',
+            # two events at the same time are ordered by id
+            from_date=datetime.datetime(2030, 1, 1 + number // 2),
+            to_date=datetime.datetime(2030, 2, 1),
+        ))
+    test_db.commit()
+
+    params = EventRequestParameters(date_from=datetime.datetime(2029, 12, 1), limit=2, fields=['id'])
+    first_page = crud.get_events_by_date_and_category(params)
 
+    assert [event['id'] for event in first_page['events']] == [100, 101]
+    assert first_page['total_count'] == 5
 
+    ids = []
+    page = first_page
+    while page['next_cursor']:
+        params.cursor = page['next_cursor']
+        page = crud.get_events_by_date_and_category(params)
+        assert page['total_count'] is None
+        ids.extend(event['id'] for event in page['events'])
+
+    assert ids == [102, 103, 104]
+
+    with pytest.raises(ValueError):
+        params.cursor = 'not a cursor'
+        crud.get_events_by_date_and_category(params)
+
+    # requests by ids are paginated in the same order
+    params = EventRequestParameters(ids=[104, 103, 102, 101, 100], limit=2, fields=['id'])
+    ids = []
+    while True:
+        page = crud.get_events_by_date_and_category(params)
+        ids.extend(event['id'] for event in page['events'])
+        if not page['next_cursor']:
+            break
+        params.cursor = page['next_cursor']
+
+    assert ids == [100, 101, 102, 103, 104]
+
+
+def test_get_approved_events_selects_only_fields(test_db, monkeypatch):
+    @contextmanager
+    def get_test_db():
+        yield test_db
+
+    monkeypatch.setattr(db_orm, 'get_db_session', get_test_db)
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    sa_event.listen(test_db.bind, 'before_cursor_execute', listener)
+
+    params = EventRequestParameters(ids=[1, 2], fields=['id', 'title'])
+    events = crud.get_approved_events(params)
+
+    sa_event.remove(test_db.bind, 'before_cursor_execute', listener)
+    assert 'full_text' not in statements[-1]
+
+    assert sorted(events, key=lambda event: event['id']) == [
+        {'id': 1, 'title': 'Test Event One'},
+        {'id': 2, 'title': 'Test Event Two'},
+    ]
+
+    with pytest.raises(ValueError):
+        crud.get_approved_events(EventRequestParameters(ids=[1], fields=['id', 'password']))
+
+
+def test_save_api_request_logs(test_db, monkeypatch):
+    @contextmanager
+    def get_test_db():
+        yield test_db
+
+    monkeypatch.setattr(db_orm, 'get_db_session', get_test_db)
+
+    crud.save_api_request_logs([
+        {'ip': '127.0.0.1', 'endpoint': f'/api/{number}', 'method': 'POST', 'status_code': 200,
+         'timestamp': datetime.datetime(2030, 1, 1), 'user_agent': None, 'request_data': None}
+        for number in range(3)
+    ])
+
+    assert test_db.query(ApiRequestLog).count() == 3
+
+
+def test_get_events_dates(test_db, monkeypatch):
+    @contextmanager
+    def get_test_db():
+        yield test_db
+
+    monkeypatch.setattr(db_orm, 'get_db_session', get_test_db)
+
+    dates = crud.get_events_dates([1, 404])
+
+    assert dates == [
+        (1, datetime.datetime(2025, 7, 1), datetime.datetime(2025, 7, 10)),
+        (404, None, None),
+    ]
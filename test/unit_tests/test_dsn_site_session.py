@@ -0,0 +1,83 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+from davai_s_nami_bot import dsn_site_session
+from davai_s_nami_bot.dsn_site_session import COOKIES_KEY, LOGIN_LOCK_KEY, DSNSiteSession
+
+
+def _response(status_code=200):
+    return MagicMock(status_code=status_code, history=[], url='test/events/')
+
+
+@pytest.fixture
+def site(mock_redis, monkeypatch):
+    mock_redis.delete(COOKIES_KEY)
+    session = MagicMock()
+    monkeypatch.setattr(dsn_site_session.http_client, 'get_session', lambda name, **kwargs: session)
+
+    logins = []
+
+    def fake_login():
+        logins.append(1)
+        return {'csrftoken': 'token', 'sessionid': f'session_{len(logins)}'}
+
+    monkeypatch.setattr(dsn_site_session, '_login', fake_login)
+    return session, logins
+
+
+def test_login_once_and_share_cookies(site, mock_redis):
+    session, logins = site
+    session.get.return_value = _response()
+
+    DSNSiteSession().get('test/events/')
+    DSNSiteSession().get('test/events/')
+
+    assert len(logins) == 1
+    assert json.loads(mock_redis.get(COOKIES_KEY))['sessionid'] == 'session_1'
+    assert session.get.call_count == 2
+
+
+def test_relogin_on_forbidden(site, mock_redis):
+    session, logins = site
+    mock_redis.set(COOKIES_KEY, json.dumps({'csrftoken': 'old', 'sessionid': 'old'}))
+    session.get.side_effect = [_response(403), _response()]
+
+    response = DSNSiteSession().get('test/events/')
+
+    assert response.status_code == 200
+    assert len(logins) == 1
+    assert session.get.call_args.kwargs['cookies']['sessionid'] == 'session_1'
+
+
+def test_login_releases_only_own_lock(site, mock_redis, monkeypatch):
+    mock_redis.delete(LOGIN_LOCK_KEY)
+
+    def slow_login():
+        # lock expired during login and other worker took it
+        mock_redis.set(LOGIN_LOCK_KEY, 'other worker')
+        return {'csrftoken': 'token', 'sessionid': 'session'}
+
+    monkeypatch.setattr(dsn_site_session, '_login', slow_login)
+    DSNSiteSession().login()
+
+    assert mock_redis.get(LOGIN_LOCK_KEY) == b'other worker'
+
+    monkeypatch.setattr(dsn_site_session, '_login', lambda: {'csrftoken': 'token', 'sessionid': 'session'})
+    mock_redis.delete(LOGIN_LOCK_KEY)
+    DSNSiteSession().login()
+
+    assert mock_redis.get(LOGIN_LOCK_KEY) is None
+
+
+def test_dsn_site_requests_are_not_resent(monkeypatch):
+    monkeypatch.setattr(dsn_site_session.http_client, '_sessions', {})
+
+    session = dsn_site_session._dsn_site_session()
+    retry = session.get_adapter('https://example.com').max_retries
+
+    assert session.timeout == (5, None)
+    assert retry.read == 0 and retry.status == 0
+    assert not retry.is_retry('GET', 504)
+
@@ -0,0 +1,105 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+import requests
+
+from davai_s_nami_bot import http_cache
+
+
+class EtagHandler(BaseHTTPRequestHandler):
+    requests_count = 0
+
+    def do_GET(self):
+        EtagHandler.requests_count += 1
+        cache_control = 'max-age=60' if self.path == '/fresh' else 'no-cache'
+
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.send_header('ETag', '"v1"')
+            self.end_headers()
+            return
+
+        body = b'<html>events</html>'
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(('127.0.0.1', 0), EtagHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    EtagHandler.requests_count = 0
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+@pytest.fixture
+def session(tmp_path):
+    session = requests.session()
+    http_cache.install(session, 'test', cache=http_cache.DiskCache(str(tmp_path)))
+    return session
+
+
+def test_revalidates_with_etag(server, session):
+    first = session.get(server + '/page')
+    second = session.get(server + '/page')
+
+    assert first.content == second.content == b'<html>events</html>'
+    assert second.status_code == 200
+    assert second.from_cache
+    assert EtagHandler.requests_count == 2
+    assert http_cache.stats()['test']['revalidated'] >= 1
+
+
+def test_fresh_entry_is_served_without_request(server, session):
+    session.get(server + '/fresh')
+    cached = session.get(server + '/fresh')
+
+    assert cached.text == '<html>events</html>'
+    assert EtagHandler.requests_count == 1
+    assert http_cache.stats()['test']['hits'] >= 1
+
+
+def test_lru_eviction(tmp_path):
+    cache = http_cache.DiskCache(str(tmp_path), max_size=60)
+
+    cache.set('first', {'status': 200}, b'x' * 10)
+    time.sleep(0.05)
+    cache.set('second', {'status': 200}, b'x' * 10)
+    time.sleep(0.05)
+    cache.get('first')
+    time.sleep(0.05)
+    cache.set('third', {'status': 200}, b'x' * 10)
+    cache.evict()
+
+    assert cache.get('first') is not None
+    assert cache.get('second') is None
+    assert cache.get('third') is not None
+
+
+class FakeParser:
+    def __init__(self, session=None):
+        if session is not None:
+            self.http = session
+
+
+def test_install_to_parser(server, tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(http_cache, '_disk_cache', http_cache.DiskCache(str(tmp_path)))
+    parser = FakeParser(requests.session())
+
+    assert http_cache.install_to_parser(parser, 'fake')
+    parser.http.get(server + '/fresh')
+    assert parser.http.get(server + '/fresh').from_cache
+
+    assert not http_cache.install_to_parser(FakeParser(), 'sessionless')
+    assert 'HTTP cache isn\'t installed for sessionless' in caplog.text
@@ -0,0 +1,91 @@
+import os
+import time
+from io import BytesIO
+from unittest.mock import MagicMock
+
+import pytest
+from PIL import Image
+
+from davai_s_nami_bot import images
+
+
+def _image_bytes(mode, size, fmt, color):
+    buffer = BytesIO()
+    Image.new(mode, size, color).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def posters_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(images, 'POSTERS_DIR', str(tmp_path))
+    return tmp_path
+
+
+def test_render_poster_downscales_jpeg():
+    data = _image_bytes('RGB', (4000, 3000), 'jpeg', (200, 10, 10))
+
+    poster = Image.open(BytesIO(images.render_poster(data)))
+
+    assert poster.format == 'JPEG'
+    assert poster.width <= images.IMG_MAXSIZE[0] and poster.height <= images.IMG_MAXSIZE[1]
+    assert poster.size == (1440, 1080)
+
+
+def test_render_poster_transparent_png_on_white():
+    data = _image_bytes('RGBA', (100, 100), 'png', (0, 0, 0, 0))
+
+    poster = Image.open(BytesIO(images.render_poster(data)))
+
+    assert poster.format == 'JPEG' and poster.mode == 'RGB'
+    assert all(channel > 250 for channel in poster.getpixel((50, 50)))
+
+
+def test_prepare_image_reuses_prerendered_poster(posters_dir, monkeypatch):
+    download = MagicMock(return_value=_image_bytes('RGB', (10, 10), 'png', (0, 0, 255)))
+    monkeypatch.setattr(images, 'download', download)
+
+    assert images.prerender_posters(['http://img/1.png', None]) == 1
+    poster = images.prepare_image('http://img/1.png')
+
+    assert Image.open(BytesIO(poster)).format == 'JPEG'
+    download.assert_called_once_with('http://img/1.png')
+    assert images.prepare_image('') is None
+    assert [p.name for p in posters_dir.iterdir()] == [images.poster_key('http://img/1.png') + '.jpg']
+
+
+def test_poster_key_depends_on_rendering_parameters(monkeypatch):
+    key = images.poster_key('http://img/1.png')
+
+    assert images.poster_key('http://img/1.png') == key
+    assert images.poster_key('http://img/1.png', (1280, 720)) != key
+    monkeypatch.setattr(images, 'JPEG_QUALITY', 80)
+    assert images.poster_key('http://img/1.png') != key
+
+
+def test_least_recently_used_posters_are_evicted(posters_dir, monkeypatch):
+    monkeypatch.setattr(images, 'download', lambda url: _image_bytes('RGB', (10, 10), 'png', (0, 0, 255)))
+    paths = []
+    for i in range(3):
+        images.prepare_image(f'http://img/{i}.png')
+        paths.append(images._poster_file(images.poster_key(f'http://img/{i}.png')))
+    for age, path in zip((30, 20, 10), paths):
+        os.utime(path, (time.time() - age, time.time() - age))
+
+    # use of the oldest poster makes it the newest one
+    images.prepare_image('http://img/0.png')
+    removed = images.evict_posters(max_bytes=2 * os.path.getsize(paths[0]))
+
+    assert removed == 1
+    assert [os.path.exists(path) for path in paths] == [True, False, True]
+
+
+def test_poster_metadata_in_redis(posters_dir, mock_redis, monkeypatch):
+    monkeypatch.setattr(images, 'redis_client', mock_redis)
+    monkeypatch.setattr(images, 'POSTERS_REDIS_METADATA', True)
+    monkeypatch.setattr(images, 'download', lambda url: _image_bytes('RGB', (10, 10), 'png', (0, 0, 255)))
+
+    poster = images.prepare_image('http://img/meta.png')
+
+    metadata = mock_redis.hgetall(f"poster:{images.poster_key('http://img/meta.png')}")
+    assert metadata[b'url'] == b'http://img/meta.png'
+    assert int(metadata[b'size']) == len(poster)
@@ -0,0 +1,82 @@
+import datetime
+
+import pytest
+
+from davai_s_nami_bot import request_log
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    batches = []
+    monkeypatch.setattr(request_log.crud, 'save_api_request_logs', batches.append)
+    return batches
+
+
+def _record(number):
+    return {
+        'ip': '127.0.0.1', 'endpoint': f'/api/{number}', 'method': 'POST', 'status_code': 200,
+        'timestamp': datetime.datetime(2030, 1, 1, 12), 'user_agent': None, 'request_data': None,
+    }
+
+
+def test_records_are_written_in_batches(saved, tmp_path):
+    buffer = request_log.RequestLogBuffer(flush_size=3, spill_dir=str(tmp_path))
+    for number in range(7):
+        buffer.add(_record(number))
+
+    buffer.flush()
+
+    assert [len(batch) for batch in saved] == [3, 3, 1]
+
+
+def test_records_are_spilled_and_replayed(saved, monkeypatch, tmp_path):
+    def unavailable(records):
+        raise ConnectionError('database is unavailable')
+
+    buffer = request_log.RequestLogBuffer(flush_size=2, spill_dir=str(tmp_path))
+    with monkeypatch.context() as patch:
+        patch.setattr(request_log.crud, 'save_api_request_logs', unavailable)
+        for number in range(3):
+            buffer.add(_record(number))
+        buffer.flush()
+
+    assert saved == []
+    assert len(list(tmp_path.iterdir())) == 2
+
+    buffer.add(_record(3))
+    buffer.flush()
+
+    endpoints = sorted(record['endpoint'] for batch in saved for record in batch)
+    assert endpoints == ['/api/0', '/api/1', '/api/2', '/api/3']
+    assert all(isinstance(record['timestamp'], datetime.datetime) for batch in saved for record in batch)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_full_buffer_spills_oldest_records(saved, tmp_path):
+    buffer = request_log.RequestLogBuffer(flush_size=2, max_buffer_size=4, spill_dir=str(tmp_path))
+    for number in range(4):
+        buffer._records.append(_record(number))
+
+    buffer.add(_record(4))
+
+    assert len(buffer._records) == 3
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_full_buffer_spills_in_thread_from_event_loop(saved, monkeypatch, tmp_path):
+    import asyncio
+    import threading
+
+    buffer = request_log.RequestLogBuffer(flush_size=2, max_buffer_size=4, spill_dir=str(tmp_path))
+    for number in range(4):
+        buffer._records.append(_record(number))
+
+    spilled_in = []
+    spill = buffer._spill
+    monkeypatch.setattr(buffer, '_spill', lambda records: spilled_in.append(threading.get_ident()) or spill(records))
+
+    asyncio.run(buffer.add_async(_record(4)))
+
+    assert spilled_in and spilled_in[0] != threading.get_ident()
+    assert len(buffer._records) == 3
+    assert len(list(tmp_path.iterdir())) == 1
@@ -0,0 +1,167 @@
+import time
+
+from davai_s_nami_bot import scraping
+
+
+def _broken():
+    raise RuntimeError("site is down")
+
+
+def test_rate_limiter_limits_requests_per_second():
+    limiter = scraping.RateLimiter(rate=10, capacity=1)
+
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+
+    assert time.monotonic() - start >= 0.45
+
+
+def test_get_timepad_events_fetches_skip_windows(monkeypatch):
+    from types import SimpleNamespace
+    from davai_s_nami_bot import events
+
+    total = 730
+    requested_skips = []
+
+    def fake_get_events(parser, request_params, tags):
+        skip = request_params['skip']
+        requested_skips.append(skip)
+        ids = range(skip, min(skip + request_params['limit'], total))
+        return [SimpleNamespace(event_id=f"TIMEPAD_{i}") for i in ids]
+
+    monkeypatch.setattr(events, '_get_events', fake_get_events)
+    monkeypatch.setattr(events, 'timepad_rate_limiter', scraping.RateLimiter(rate=1000))
+
+    result = events.get_timepad_events(7, request_params={'limit': 100, 'cities': 'spb'})
+
+    assert len(result) == total
+    assert len({e.event_id for e in result}) == total
+    assert sorted(requested_skips) == [i * 100 for i in range(len(requested_skips))]
+    assert max(requested_skips) >= 700
+
+
+def test_iter_timepad_events_skip_window_starts_at_min(monkeypatch):
+    from davai_s_nami_bot import events
+
+    requested = []
+
+    def fake_get_events(parser, request_params, tags):
+        requested.append(dict(request_params))
+        return []
+
+    monkeypatch.setattr(events, '_get_events', fake_get_events)
+    monkeypatch.setattr(events, 'timepad_rate_limiter', scraping.RateLimiter(rate=1000))
+
+    list(events.iter_timepad_events(7, request_params={'limit': 100, 'cities': 'spb'}, skip_days=3))
+
+    # same events as in the window without skip: from 10:00
+    assert requested[0]['starts_at_min'].endswith('T10:00:00')
+
+
+def _slow_stream(items, delay):
+    def stream():
+        for item in items:
+            time.sleep(delay)
+            yield item
+    return stream
+
+
+def test_stream_concurrently_merges_sources():
+    streams = {
+        'first': _slow_stream(['a1', 'a2', 'a3'], 0.05),
+        'second': _slow_stream(['b1', 'b2'], 0.05),
+        'broken': _broken,
+    }
+
+    items = list(scraping.stream_concurrently(streams))
+
+    assert sorted(items) == ['a1', 'a2', 'a3', 'b1', 'b2']
+
+
+def test_stream_concurrently_runs_sources_in_parallel():
+    streams = {source: _slow_stream([source], 0.3) for source in ('first', 'second', 'third')}
+
+    start = time.monotonic()
+    items = list(scraping.stream_concurrently(streams))
+
+    assert time.monotonic() - start < 0.8
+    assert sorted(items) == ['first', 'second', 'third']
+
+
+def test_stream_concurrently_is_bounded():
+    produced = []
+
+    def stream():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    consumer = scraping.stream_concurrently({'source': stream}, queue_size=5)
+    first = next(consumer)
+    time.sleep(0.2)
+
+    assert first == 0
+    assert len(produced) <= 8
+
+    assert list(consumer) == list(range(1, 100))
+
+
+def test_stream_concurrently_drops_timed_out_source():
+    streams = {
+        'ok': _slow_stream(['a'], 0),
+        'hanging': _slow_stream(['late'], 2),
+    }
+
+    start = time.monotonic()
+    items = list(scraping.stream_concurrently(streams, source_timeout=0.3))
+
+    assert time.monotonic() - start < 1.5
+    assert items == ['a']
+
+
+def test_stream_concurrently_doesnt_count_waiting_for_consumer():
+    consumer = scraping.stream_concurrently(
+        {'source': _slow_stream(range(20), 0.01)}, source_timeout=0.5, queue_size=2
+    )
+
+    items = []
+    for item in consumer:
+        # slow inserts block producer longer than source_timeout
+        time.sleep(0.05)
+        items.append(item)
+
+    assert items == list(range(20))
+
+
+def test_stream_concurrently_stops_when_budget_is_over():
+    consumer = scraping.stream_concurrently(
+        {'source': _slow_stream(range(100), 0.01)}, source_timeout=10, budget=0.5,
+        queue_size=2, results=True,
+    )
+
+    start = time.monotonic()
+    items = []
+    for item in consumer:
+        # waiting for the consumer is counted by budget
+        time.sleep(0.05)
+        items.append(item)
+
+    assert time.monotonic() - start < 1
+    assert 0 < len(items) < 100
+    assert items[-1].timed_out
+
+
+def test_stream_concurrently_yields_source_results():
+    def stream():
+        yield 'a'
+        return 'checkpoint'
+
+    items = list(scraping.stream_concurrently({'source': stream, 'broken': _broken}, results=True))
+
+    assert items[:1] == ['a']
+    results = {item.source: item for item in items[1:]}
+    assert results['source'].ok and results['source'].sync == 'checkpoint'
+    assert not results['broken'].ok and results['broken'].sync is None
+    # result comes after all items of its source
+    assert items.index(results['source']) > items.index('a')
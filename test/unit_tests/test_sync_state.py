@@ -0,0 +1,102 @@
+import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from davai_s_nami_bot import sync_state
+
+
+@pytest.fixture(autouse=True)
+def clean_state(mock_redis):
+    for key in mock_redis.keys('sync_state:*'):
+        mock_redis.delete(key)
+
+
+def _event(event_id, title='title'):
+    return SimpleNamespace(
+        event_id=event_id, title=title, url='url', image='image.jpg',
+        price='100', address='address',
+        from_date=datetime.datetime(2030, 1, 1, 19), to_date=None,
+    )
+
+
+def test_first_sync_is_full():
+    window = sync_state.plan_window('radario', 7)
+
+    assert window.full
+    assert window.skip_days == 0
+
+
+def test_next_day_requests_only_window_edge():
+    today = datetime.date(2030, 1, 1)
+    sync_state.mark_synced(sync_state.plan_window('radario', 7, today=today), today=today)
+
+    window = sync_state.plan_window('radario', 7, today=today + datetime.timedelta(days=1))
+
+    assert not window.full
+    assert window.skip_days == 6
+    assert window.synced_at is not None
+
+
+def test_full_sync_after_interval(monkeypatch):
+    today = datetime.date(2030, 1, 1)
+    sync_state.mark_synced(sync_state.plan_window('radario', 7, today=today), today=today)
+
+    later = sync_state.get_msk_today() + sync_state.FULL_SYNC_INTERVAL
+    monkeypatch.setattr(sync_state, 'get_msk_today', lambda: later)
+
+    assert sync_state.plan_window('radario', 7, today=today).full
+
+
+def _sync(source, events, skip_known=True):
+    hashes = {}
+    changed = list(sync_state.only_changed(source, events, hashes, skip_known=skip_known))
+    return changed, hashes
+
+
+def test_only_changed_skips_seen_events():
+    window = sync_state.plan_window('vk', 7)
+    first = [_event('A'), _event('B')]
+    changed, hashes = _sync('vk', first)
+    assert changed == first
+
+    # hashes are known only after sync is marked
+    assert _sync('vk', first)[0] == first
+    sync_state.mark_synced(window, hashes)
+
+    second = [_event('A'), _event('B', title='new title'), _event('C')]
+    changed, _ = _sync('vk', second)
+
+    assert [event.event_id for event in changed] == ['B', 'C']
+    assert len(_sync('vk', second, skip_known=False)[0]) == 3
+
+
+def test_full_sync_rewrites_hashes(mock_redis):
+    window = sync_state.plan_window('vk', 7)
+    sync_state.mark_synced(window, _sync('vk', [_event('PAST'), _event('A')])[1])
+
+    # past event isn't scraped by the next full sync
+    full_window = window._replace(full=True)
+    sync_state.mark_synced(full_window, _sync('vk', [_event('A')], skip_known=False)[1])
+
+    assert set(mock_redis.hkeys('sync_state:vk:hashes')) == {b'A'}
+
+
+def test_sync_is_saved_after_events_are_inserted(monkeypatch):
+    from davai_s_nami_bot import celery_tasks, scraping
+
+    window = sync_state.plan_window('vk', 7)
+    checkpoint = sync_state.Checkpoint(window, {'A': 'hash'})
+    stream = [_event('A'), scraping.SourceResult('vk', 0.1, count=1, sync=checkpoint)]
+
+    def failed_insert(events, table, msk_today):
+        raise RuntimeError('database is down')
+
+    monkeypatch.setattr(celery_tasks, '_update_events', failed_insert)
+    with pytest.raises(RuntimeError):
+        celery_tasks._update_events_stream(iter(stream), 'events_eventsnotapprovednew', None)
+    assert sync_state.plan_window('vk', 7).full
+
+    monkeypatch.setattr(celery_tasks, '_update_events', lambda events, table, msk_today: [1])
+    celery_tasks._update_events_stream(iter(stream), 'events_eventsnotapprovednew', None)
+    assert not sync_state.plan_window('vk', 7).full
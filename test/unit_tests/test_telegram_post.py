@@ -1,3 +1,6 @@
+import time
+from io import BytesIO
+
 import pytest
 from unittest.mock import MagicMock
 from contextlib import contextmanager
@@ -37,7 +40,7 @@ def mock_telegram_super_send_post(monkeypatch):
 
     original_base_send_post = BaseClient.send_post
 
-    def mock_base_send_post(self, event, image_path, environ="prod"):
+    def mock_base_send_post(self, event, image, environ="prod"):
 
         return mock_message
 
@@ -97,6 +100,81 @@ def test_post_to_telegram_with_exhibition(mock_telegram_super_send_post, monkeyp
     add_exhibition_mock.assert_called_once_with(mock_event, 12345)
 
 
+def test_send_image_uploads_bytes(monkeypatch):
+    telegram = Telegram()
+    uploaded = {}
+
+    def send_photo(chat_id, photo, caption):
+        uploaded['name'], uploaded['data'] = photo.name, photo.read()
+        return MagicMock(message_id=12345)
+
+    monkeypatch.setattr(telegram, '_client', MagicMock(send_photo=send_photo))
+
+    telegram.send_image('text', b'jpeg bytes', destination_id=1)
+
+    assert uploaded == {'name': clients.IMAGE_FILE_NAME, 'data': b'jpeg bytes'}
+
+
+def test_clients_send_post_concurrently(monkeypatch):
+    def fake_client(name, delay, error=None, post_timeout=1):
+        def send_post(event, image):
+            time.sleep(delay)
+            if error is not None:
+                raise error
+            return name
+
+        return MagicMock(send_post=send_post, post_timeout=post_timeout, **{'name': name})
+
+    all_clients = Clients.__new__(Clients)
+    all_clients._clients = [
+        fake_client('slow', 0.3),
+        fake_client('failed', 0.1, error=ValueError('VK error')),
+        fake_client('hanging', 2, post_timeout=0.2),
+    ]
+
+    started = time.monotonic()
+    slow, failed, hanging = all_clients.send_post(event=None, image=b'')
+
+    assert time.monotonic() - started < 0.6
+    assert slow.ok and slow.result == 'slow' and slow.elapsed >= 0.3
+    assert not failed.ok and isinstance(failed.error, ValueError)
+    assert hanging.timed_out and not hanging.ok
+
+
+def test_vk_upload_url_is_shared_and_refreshed(mock_redis, monkeypatch):
+    monkeypatch.setattr(clients, 'redis_client', mock_redis)
+    key = clients.VKRequests()._wall_upload_url_key(1)
+    mock_redis.delete(key)
+    upload_server_url = clients.VKRequests.api_urls['upload_photo_wall']
+    calls, servers, expired = [], [], set()
+
+    def requests_post(url, data=None, json=None, files=None, return_key='response'):
+        calls.append(url)
+        if url == upload_server_url:
+            servers.append(f'https://upload/{len(servers)}')
+            return {'upload_url': servers[-1]}
+        if url in expired:
+            return {'error': 'expired'}
+        return {'server': 1, 'photo': '[{"photo": 1}]', 'hash': 'h'}
+
+    monkeypatch.setattr(clients, '_requests_post', requests_post)
+    monkeypatch.setattr(
+        clients.VKRequests, '_get_photo_attachments_str_wall', lambda self, params, group_id: 'photo1_1'
+    )
+
+    clients.VKRequests()._upload_image_to_wall(1, BytesIO(b'jpeg'))
+    # other instance (next post) reuses upload url
+    clients.VKRequests()._upload_image_to_wall(1, BytesIO(b'jpeg'))
+    assert calls == [upload_server_url, 'https://upload/0', 'https://upload/0']
+
+    # rejected url is replaced
+    calls.clear()
+    expired.add('https://upload/0')
+    clients.VKRequests()._upload_image_to_wall(1, BytesIO(b'jpeg'))
+    assert calls == ['https://upload/0', upload_server_url, 'https://upload/1']
+    assert mock_redis.get(key) == b'https://upload/1'
+
+
 def test_post_to_telegram_no_event(mock_db_session, mock_clients, mock_dev_channel,
                                    mock_schedule_posting_tasks, mock_utils, monkeypatch):
     # Return None for crud.get_event_to_post_now